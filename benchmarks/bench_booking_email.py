@@ -0,0 +1,64 @@
+"""Booking latency with email notifications turned on.
+
+Compares /passenger/book_seat when the notification is sent inline against
+the background outbox. The sink sleeps for SINK_LATENCY seconds to stand in
+for the SendGrid round trip.
+
+    python benchmarks/bench_booking_email.py
+"""
+import statistics
+import time
+
+import bench_env  # noqa: F401
+
+from fastapi.testclient import TestClient
+
+import datagen
+import main
+from fake_supabase import FakeSupabase
+
+SINK_LATENCY = 0.2
+REQUESTS = 20
+
+
+class SlowSink(main.LocalSink):
+    def send(self, to_emails, subject, content):
+        time.sleep(SINK_LATENCY)
+        super().send(to_emails, subject, content)
+
+
+def measure(client, headers, tables) -> list:
+    passenger_id = tables["passenger"][0]["ssn"]
+    ticket = {"ticket_id": 1, "seat_number": None, "flight_number": tables["flight"][0]["flight_number"],
+              "payment_id": 1, "passenger_id": passenger_id, "status": "active"}
+    latencies = []
+    for _ in range(REQUESTS):
+        start = time.perf_counter()
+        client.post("/passenger/book_seat", json=ticket, headers=headers).raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+if __name__ == "__main__":
+    # Few seats taken, so every booking in both runs finds a free seat
+    tables = datagen.generate(days=1, flights_per_day=1, load=0.1)
+    main.supabase = FakeSupabase(tables)
+    sink = SlowSink()
+    headers = {"Authorization": "Bearer " + main.create_access_token({"sub": tables["passenger"][0]["ssn"]})}
+
+    async def send_inline(to_email, subject, content):
+        sink.send([to_email], subject, content)
+
+    with TestClient(main.app) as client:
+        # The outbox is created by the lifespan, so its sink is swapped once the client has started
+        main.email_outbox.sink = sink
+        outbox_send_email = main.send_email
+        main.send_email = send_inline
+        inline = measure(client, headers, tables)
+        main.send_email = outbox_send_email
+        outbox = measure(client, headers, tables)
+        main.email_outbox.drain()
+
+    for name, latencies in (("inline", inline), ("outbox", outbox)):
+        print(f"{name:>6}: p50 {statistics.median(latencies):7.1f} ms  max {max(latencies):7.1f} ms")
+    print(f"delivered {len(sink.messages)} messages, {main.email_outbox.pending()} pending")
@@ -0,0 +1,60 @@
+"""Throughput of an async endpoint against a slow backend at rising concurrency.
+
+Every query sleeps for LATENCY seconds to stand in for a PostgREST round trip.
+With blocking calls on the event loop throughput stays flat; with the bounded
+offload in main.execute it should grow with concurrency up to DB_CONCURRENCY.
+/maintenance is used because it queries Supabase on every request; the
+round trips per request are printed so a cached endpoint cannot slip in.
+
+    python benchmarks/bench_db_concurrency.py
+"""
+import asyncio
+import time
+
+import bench_env  # noqa: F401
+
+import httpx
+
+import datagen
+import main
+from fake_supabase import FakeSupabase
+
+LATENCY = 0.05
+REQUESTS = 64
+
+
+async def run(backend, headers: dict, planes: list, concurrency: int):
+    transport = httpx.ASGITransport(app=main.app)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(i: int):
+            async with semaphore:
+                response = await client.get("/maintenance", params={"plane_id": planes[i % len(planes)]}, headers=headers)
+                response.raise_for_status()
+
+        calls_before = sum(backend.calls.values())
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(REQUESTS)))
+        return REQUESTS / (time.perf_counter() - start), (sum(backend.calls.values()) - calls_before) / REQUESTS
+
+
+async def main_async():
+    tables = datagen.generate()
+    backend = FakeSupabase(tables, latency=LATENCY)
+    main.supabase = backend
+    headers = {"Authorization": "Bearer " + main.create_access_token({"sub": datagen.EMPLOYEE_SSN})}
+    planes = [plane["registration_number"] for plane in tables["plane"]]
+
+    async with main.app.router.lifespan_context(main.app):
+        while not main.warmup.ready:
+            await asyncio.sleep(0.01)
+        # Resolve the employee once so the timed runs only pay for the endpoint's own query
+        await main.load_principal(datagen.EMPLOYEE_SSN)
+        for concurrency in (1, 4, 16, 32):
+            throughput, calls = await run(backend, headers, planes, concurrency)
+            print(f"concurrency={concurrency:>3}  {throughput:8.1f} req/s  {calls:.2f} round trips/request")
+
+
+if __name__ == "__main__":
+    asyncio.run(main_async())
@@ -0,0 +1,15 @@
+"""Environment shared by the benchmark scripts.
+
+Import it before main: it points main at placeholder Supabase credentials,
+in-memory SQLite stores and the local email sink, and puts the repository
+root on sys.path. Values already set in the environment are kept.
+"""
+import os
+import sys
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+os.environ.setdefault("TOKEN_REVOCATION_DB", ":memory:")
+os.environ.setdefault("EMAIL_OUTBOX_DB", ":memory:")
+os.environ.setdefault("EMAIL_SINK", "local")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
@@ -0,0 +1,83 @@
+"""Aggregation cost of a year of synthetic flights.
+
+Times main.aggregate_flight_loads for every group_by against a plain Python
+loop that computes the same numbers. Each figure is the median of REPEAT runs
+after a warm-up call, so the NumPy import is not counted.
+
+    python benchmarks/bench_range_analytics.py
+"""
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+import bench_env  # noqa: F401
+
+import main
+
+DAYS = 365
+FLIGHTS_PER_DAY = 120
+PLANES = 80
+REPEAT = 5
+CITIES = ["Riyadh", "Jeddah", "Dammam", "Medina", "Abha", "Tabuk", "Dubai", "Cairo"]
+
+
+def synthetic_year(seed: int = 321):
+    rng = random.Random(seed)
+    seat_counts = {f"HZ-{i:03d}": rng.choice((120, 150, 180, 300)) for i in range(PLANES)}
+    planes = list(seat_counts)
+    flights, booked_counts = [], {}
+    start = date(2025, 1, 1)
+    for day in range(DAYS):
+        for n in range(FLIGHTS_PER_DAY):
+            departure, destination = rng.sample(CITIES, 2)
+            flight = {
+                "flight_number": f"SV{day:03d}{n:03d}",
+                "plane_id": rng.choice(planes),
+                "departure_city": departure,
+                "destination_city": destination,
+                "date": (start + timedelta(days=day)).isoformat(),
+            }
+            flights.append(flight)
+            booked_counts[flight["flight_number"]] = rng.randint(0, seat_counts[flight["plane_id"]])
+    return flights, seat_counts, booked_counts
+
+
+def python_loop(flights, seat_counts, booked_counts, group_by):
+    columns = main.ANALYTICS_GROUPS[group_by]
+    groups = {}
+    for flight in flights:
+        key = tuple(str(flight[column]) for column in columns)
+        total = seat_counts.get(flight["plane_id"], 0)
+        booked = booked_counts.get(flight["flight_number"], 0)
+        group = groups.setdefault(key, [0, 0, 0, 0.0])
+        group[0] += 1
+        group[1] += total
+        group[2] += booked
+        group[3] += booked * 100 / total if total else 0
+    return [
+        {**dict(zip(columns, key)), "flights": n, "total_seats": total, "booked_seats": booked,
+         "load_factor": booked * 100 / total if total else 0, "booking_percentage": percentage / n}
+        for key, (n, total, booked, percentage) in sorted(groups.items())
+    ]
+
+
+def timed(function, *args):
+    result = function(*args)
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        function(*args)
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, statistics.median(timings)
+
+
+if __name__ == "__main__":
+    flights, seat_counts, booked_counts = synthetic_year()
+    print(f"{len(flights)} flights over {DAYS} days on {PLANES} planes")
+    for group_by in main.ANALYTICS_GROUPS:
+        aggregated, aggregated_ms = timed(main.aggregate_flight_loads, flights, seat_counts, booked_counts, group_by)
+        looped, looped_ms = timed(python_loop, flights, seat_counts, booked_counts, group_by)
+        assert len(aggregated) == len(looped)
+        assert all(abs(a["load_factor"] - b["load_factor"]) < 1e-9 for a, b in zip(aggregated, looped))
+        print(f"group_by={group_by:<6} groups={len(aggregated):>6}  main {aggregated_ms:7.1f} ms  python {looped_ms:7.1f} ms")
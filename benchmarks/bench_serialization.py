@@ -0,0 +1,96 @@
+"""Bytes on the wire and CPU per response for the hot list endpoints.
+
+For each payload, compares the old path (select * from Supabase, then the
+response model validates the rows and FastAPI encodes them with
+jsonable_encoder and json.dumps) with the projected path (select only the
+model's columns, then main.shape_rows and main.dump_json) and with a sparse
+fields= request. Bytes are counted on both hops: Supabase to the API and the
+API to the client. CPU is process time per response, median of --repeat runs.
+
+    python benchmarks/bench_serialization.py
+    python benchmarks/bench_serialization.py --rows 500 --repeat 9
+    python benchmarks/bench_serialization.py --no-orjson
+"""
+import argparse
+import json
+import statistics
+import time
+from typing import List
+
+import bench_env  # noqa: F401
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+import datagen
+import main
+from fake_supabase import FakeSupabase
+
+# (payload, table, response model, fields= for the sparse variant)
+PAYLOADS = [
+    ("flights", "flight", main.Flight, "flight_number,time"),
+    ("maintenance", "maintenance", main.Maintenance, "plane_id,maintenance_date"),
+    ("payments", "payment", main.Payment, "payment_id,amount"),
+]
+
+
+def wire(rows) -> int:
+    # PostgREST answers with compact JSON
+    return len(json.dumps(rows, separators=(",", ":"), default=str).encode())
+
+
+def validated(rows: List[dict], model) -> bytes:
+    # What response_model plus JSONResponse did: validate, jsonable_encoder, compact json.dumps
+    adapter = TypeAdapter(List[model])
+    return json.dumps(jsonable_encoder(adapter.validate_python(rows)), separators=(",", ":")).encode()
+
+
+def projected(rows: List[dict], columns: List[str], model) -> bytes:
+    return main.dump_json(main.shape_rows(rows, columns, model))
+
+
+def cpu_per_call(function, repeat: int, number: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.process_time()
+        for _ in range(number):
+            function()
+        timings.append((time.process_time() - start) / number)
+    return statistics.median(timings)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200, help="rows per response")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--number", type=int, default=50, help="responses encoded per timing run")
+    parser.add_argument("--no-orjson", action="store_true", help="measure the json fallback used without orjson")
+    args = parser.parse_args()
+    if args.no_orjson:
+        main.orjson = None
+
+    backend = FakeSupabase(datagen.generate(days=30, flights_per_day=20, planes=100))
+    print(f"JSON encoder: {'orjson' if main.orjson is not None else 'json'}")
+    print(f"{'payload':<13}{'path':<11}{'rows':>6}{'db bytes':>10}{'api bytes':>11}{'cpu us':>9}{'speedup':>9}")
+    for name, table, model, fields in PAYLOADS:
+        def fetch(columns):
+            return backend.table(table).select(columns).limit(args.rows).execute().data
+
+        variants = [("select *", fetch("*"), None)]
+        for label, columns in (("projected", main.select_columns(model)), ("fields=", main.select_columns(model, fields))):
+            variants.append((label, fetch(", ".join(columns)), columns))
+
+        baseline = None
+        for label, rows, columns in variants:
+            if columns is None:
+                encode = lambda: validated(rows, model)
+            else:
+                encode = lambda: projected(rows, columns, model)
+            cpu = cpu_per_call(encode, args.repeat, args.number)
+            baseline = baseline or cpu
+            print(f"{name:<13}{label:<11}{len(rows):>6}{wire(rows):>10}{len(encode()):>11}"
+                  f"{cpu * 1e6:>9.0f}{baseline / cpu:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main_cli()
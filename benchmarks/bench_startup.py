@@ -0,0 +1,72 @@
+"""Worker cold-start time.
+
+Starts a fresh interpreter per run and measures how long it takes to import
+main, to finish the lifespan startup (the point where a worker can accept
+requests and answer /healthz) and to become ready (/readyz returns 200) with
+the Supabase stand-in answering after LATENCY seconds per call. Creating a
+real Supabase client is timed separately; it does not touch the network.
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 10 --latency-ms 50
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+import bench_env  # noqa: F401
+
+
+async def child(latency: float) -> dict:
+    import datagen
+    from fake_supabase import FakeSupabase
+    tables = datagen.generate()
+
+    start = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+
+    main.supabase = FakeSupabase(tables, latency=latency)
+    async with main.app.router.lifespan_context(main.app):
+        serving = time.perf_counter()
+        while not main.warmup.ready:
+            await asyncio.sleep(0.001)
+        ready = time.perf_counter()
+
+    client_start = time.perf_counter()
+    main.create_supabase_client()
+    client_created = time.perf_counter()
+    return {
+        "import_ms": (imported - start) * 1000,
+        "serving_ms": (serving - start) * 1000,
+        "ready_ms": (ready - start) * 1000,
+        "create_client_ms": (client_created - client_start) * 1000,
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="simulated Supabase round-trip time")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(child(args.latency_ms / 1000))))
+        return
+
+    runs = []
+    for _ in range(args.runs):
+        output = subprocess.run([sys.executable, __file__, "--child", "--latency-ms", str(args.latency_ms)],
+                                capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    for name in ("import_ms", "serving_ms", "ready_ms", "create_client_ms"):
+        values = [run[name] for run in runs]
+        print(f"{name:<18} median {statistics.median(values):8.1f} ms  min {min(values):8.1f} ms  max {max(values):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main_cli()
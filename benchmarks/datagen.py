@@ -0,0 +1,99 @@
+"""Synthetic airline data for the offline benchmarks.
+
+generate() returns tables shaped like the Supabase schema main.py queries:
+person, admin, employee, passenger, plane, aircraft_seatstype, flight, seat,
+payment, ticket, maintenance and manage. The output is deterministic for a
+given seed.
+"""
+import random
+from datetime import date, timedelta
+
+CITIES = ["Riyadh", "Jeddah", "Dammam", "Medina", "Abha", "Tabuk", "Dubai", "Cairo"]
+AIRCRAFT = {
+    "A320": {"economy": 150, "business": 12},
+    "B737": {"economy": 138, "business": 16},
+    "B787": {"economy": 232, "business": 24, "first": 6},
+    "E190": {"economy": 88, "business": 8},
+}
+SEAT_LETTERS = "ABCDEF"
+ADMIN_SSN = "1000000000"
+EMPLOYEE_SSN = "1000000001"
+PASSWORD = "password"
+
+
+def seat_numbers(count: int):
+    return [f"{row}{letter}" for row in range(1, count // len(SEAT_LETTERS) + 2) for letter in SEAT_LETTERS][:count]
+
+
+def person(ssn: str, username: str):
+    return {
+        "ssn": ssn, "username": username, "password": PASSWORD, "email": f"{username}@example.com",
+        "first_name": username.title(), "father_name": "Bin", "family": "Test", "phone": "0500000000",
+    }
+
+
+def generate(seed: int = 321, passengers: int = 500, planes: int = 20, days: int = 14, flights_per_day: int = 10,
+             load: float = 0.6, waitlisted_per_flight: int = 3, start: date = None):
+    rng = random.Random(seed)
+    start = start or date.today()
+
+    tables = {name: [] for name in (
+        "person", "admin", "employee", "passenger", "plane", "aircraft_seatstype", "flight", "seat",
+        "payment", "ticket", "maintenance", "manage")}
+    tables["person"] += [person(ADMIN_SSN, "admin"), person(EMPLOYEE_SSN, "employee")]
+    tables["admin"].append({"ssn": ADMIN_SSN})
+    tables["employee"].append({"ssn": EMPLOYEE_SSN})
+
+    passenger_ssns = [str(2000000000 + i) for i in range(passengers)]
+    for i, ssn in enumerate(passenger_ssns):
+        tables["person"].append(person(ssn, f"passenger{i}"))
+        tables["passenger"].append({"ssn": ssn})
+
+    for aircraft_id, classes in AIRCRAFT.items():
+        for seat_type, number_of_seats in classes.items():
+            tables["aircraft_seatstype"].append(
+                {"aircraft_id": aircraft_id, "seat_type": seat_type, "number_of_seats": number_of_seats})
+
+    capacity = {}
+    for i in range(planes):
+        registration_number = f"HZ-{i:03d}"
+        aircraft_id = rng.choice(list(AIRCRAFT))
+        tables["plane"].append({"registration_number": registration_number, "aircraft_id": aircraft_id})
+        capacity[registration_number] = sum(AIRCRAFT[aircraft_id].values())
+        for n in range(4):
+            tables["maintenance"].append({
+                "maintenance_id": len(tables["maintenance"]) + 1, "plane_id": registration_number,
+                "employee_id": EMPLOYEE_SSN, "maintenance_type": rng.choice(["A-check", "B-check", "engine"]),
+                "maintenance_date": (start + timedelta(days=rng.randint(-365, 60))).isoformat(), "notes": None,
+            })
+
+    ticket_id = 0
+    for day in range(days):
+        flight_date = (start + timedelta(days=day)).isoformat()
+        for n in range(flights_per_day):
+            departure, destination = rng.sample(CITIES, 2)
+            plane_id = rng.choice(tables["plane"])["registration_number"]
+            flight_number = f"SV{day:03d}{n:02d}"
+            tables["flight"].append({
+                "flight_number": flight_number, "plane_id": plane_id, "departure_city": departure,
+                "destination_city": destination, "date": flight_date, "time": f"{6 + n % 16:02d}:00",
+            })
+            seats = seat_numbers(capacity[plane_id])
+            tables["seat"] += [{"flight_id": flight_number, "seat_number": seat} for seat in seats]
+
+            sold = rng.sample(seats, int(len(seats) * load))
+            statuses = [(seat, rng.choice(["active", "active", "confirmed", "cancelled"])) for seat in sold]
+            statuses += [(None, "waitlisted")] * waitlisted_per_flight
+            for seat, status in statuses:
+                ticket_id += 1
+                booked_on = (start - timedelta(days=rng.randint(1, 60))).isoformat()
+                tables["payment"].append({
+                    "payment_id": ticket_id, "amount": float(rng.randint(200, 2500)),
+                    "date": booked_on, "method": rng.choice(["card", "cash", "transfer"]),
+                })
+                tables["ticket"].append({
+                    "ticket_id": ticket_id, "seat_number": seat if status != "cancelled" else None,
+                    "flight_number": flight_number, "payment_id": ticket_id,
+                    "passenger_id": rng.choice(passenger_ssns), "date_of_booking": booked_on, "status": status,
+                })
+    return tables
@@ -0,0 +1,406 @@
+"""In-process stand-in for the Supabase client used by main.py.
+
+Implements the PostgREST builder chain the API relies on
+(table().select().eq().in_().gt().order().limit().range().single().execute(), insert,
+update, upsert and delete), many-to-one resource embedding in select lists,
+the partial unique indexes from sql/ and registered rpc() functions over
+plain Python tables. Every execute() can sleep for a fixed latency to model the network
+round trip and is counted per table, so benchmarks can report round trips
+without a live project.
+"""
+import re
+import threading
+import time
+import types
+from collections import Counter
+from datetime import date, datetime
+
+PRIMARY_KEYS = {
+    "ticket": "ticket_id",
+    "payment": "payment_id",
+    "maintenance": "maintenance_id",
+    "person": "ssn",
+    "passenger": "ssn",
+    "admin": "ssn",
+    "employee": "ssn",
+    "plane": "registration_number",
+    "flight": "flight_number",
+}
+
+# Many-to-one relations that select() can embed: (table, embedded table) -> (local column, remote column)
+FOREIGN_KEYS = {
+    ("ticket", "passenger"): ("passenger_id", "ssn"),
+    ("ticket", "flight"): ("flight_number", "flight_number"),
+    ("ticket", "payment"): ("payment_id", "payment_id"),
+    ("passenger", "person"): ("ssn", "ssn"),
+    ("admin", "person"): ("ssn", "ssn"),
+    ("employee", "person"): ("ssn", "ssn"),
+    ("flight", "plane"): ("plane_id", "registration_number"),
+}
+# Partial unique indexes from sql/: table -> (columns, rows the index covers)
+UNIQUE_INDEXES = {
+    "ticket": (("flight_number", "seat_number"), lambda row: row.get("status") in ("active", "confirmed")),
+}
+EMBEDDED = re.compile(r"^(\w+)(!inner)?\((.*)\)$", re.S)
+
+
+def _split_columns(columns: str) -> list:
+    parts, depth, current = [], 0, ""
+    for char in columns:
+        if char == "," and depth == 0:
+            parts.append(current.strip())
+            current = ""
+            continue
+        depth += (char == "(") - (char == ")")
+        current += char
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+
+class FakeAPIError(Exception):
+    def __init__(self, message: str, code: str = None):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+
+
+class FakeResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+def _normalize(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _compare_key(row_value, value):
+    row_value, value = _normalize(row_value), _normalize(value)
+    if isinstance(row_value, (int, float)) and not isinstance(row_value, bool) and isinstance(value, str):
+        try:
+            return row_value, float(value)
+        except ValueError:
+            return str(row_value), value
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and isinstance(row_value, str):
+        try:
+            return float(row_value), value
+        except ValueError:
+            return row_value, str(value)
+    return row_value, value
+
+
+def _order_key(value):
+    value = _normalize(value)
+    return (value is None, value if isinstance(value, (int, float)) else str(value) if value is not None else "")
+
+
+class FakeQuery:
+    def __init__(self, backend, table: str):
+        self.backend = backend
+        self.table_name = table
+        self.request = types.SimpleNamespace(path=f"fake://rest/v1/{table}", http_method="GET")
+        self._operation = "select"
+        self._payload = None
+        self._columns = "*"
+        self._filters = []
+        self._equals = []
+        self._orders = []
+        self._limit = None
+        self._offset = 0
+        self._single = False
+        self._count = None
+        self._head = False
+        self._on_conflict = None
+
+    # Operations
+    def select(self, *columns, count=None, head=None):
+        self._columns = ",".join(columns) if columns else "*"
+        self._count = count
+        self._head = bool(head)
+        return self
+
+    def insert(self, payload):
+        return self._write("insert", "POST", payload)
+
+    def upsert(self, payload, on_conflict=None, **kwargs):
+        self._on_conflict = on_conflict
+        return self._write("upsert", "POST", payload)
+
+    def update(self, payload):
+        return self._write("update", "PATCH", payload)
+
+    def delete(self):
+        return self._write("delete", "DELETE", None)
+
+    def _write(self, operation, method, payload):
+        self._operation = operation
+        self._payload = payload
+        self.request.http_method = method
+        return self
+
+    # Filters
+    def _compare(self, column, value, compare):
+        value = _normalize(value)
+
+        def predicate(row):
+            row_value = row.get(column)
+            if row_value is None:
+                return False
+            if type(row_value) is type(value):
+                return compare(row_value, value)
+            left, right = _compare_key(row_value, value)
+            return compare(left, right)
+        self._filters.append(predicate)
+        return self
+
+    def eq(self, column, value):
+        self._equals.append((column, str(_normalize(value))))
+        return self._compare(column, value, lambda a, b: a == b)
+
+    def neq(self, column, value):
+        return self._compare(column, value, lambda a, b: a != b)
+
+    def gt(self, column, value):
+        return self._compare(column, value, lambda a, b: a > b)
+
+    def gte(self, column, value):
+        return self._compare(column, value, lambda a, b: a >= b)
+
+    def lt(self, column, value):
+        return self._compare(column, value, lambda a, b: a < b)
+
+    def lte(self, column, value):
+        return self._compare(column, value, lambda a, b: a <= b)
+
+    def in_(self, column, values):
+        # PostgREST sends the list as text, so membership is compared on the text form
+        wanted = {str(_normalize(value)) for value in values}
+        self._filters.append(lambda row: row.get(column) is not None and str(_normalize(row.get(column))) in wanted)
+        return self
+
+    def order(self, column, desc=False, **kwargs):
+        self._orders.append((column, desc))
+        return self
+
+    def limit(self, size, **kwargs):
+        self._limit = size
+        return self
+
+    def range(self, start, end, **kwargs):
+        self._offset = start
+        self._limit = end - start + 1
+        return self
+
+    def single(self):
+        self._single = True
+        return self
+
+    # Execution
+    def execute(self):
+        return self.backend._execute(self)
+
+    def _matches(self, row):
+        return all(predicate(row) for predicate in self._filters)
+
+
+
+class FakeRPC:
+    def __init__(self, backend, name: str, params: dict):
+        self.backend = backend
+        self.name = name
+        self.params = params
+        self.request = types.SimpleNamespace(path=f"fake://rest/v1/rpc/{name}", http_method="POST")
+
+    def execute(self):
+        return self.backend._call(self)
+
+
+class FakeSupabase:
+    def __init__(self, tables: dict = None, latency: float = 0.0, unique_indexes: bool = True):
+        self.tables = {name: [dict(row) for row in rows] for name, rows in (tables or {}).items()}
+        self.latency = latency
+        self.unique_indexes = UNIQUE_INDEXES if unique_indexes else {}
+        self.calls = Counter()
+        self.functions = {
+            "get_available_seats": get_available_seats,
+            "count_active_tickets": count_active_tickets,
+            "count_changes_by_admin": count_changes_by_admin,
+        }
+        self._lock = threading.RLock()
+        self._sequences = Counter()
+        self._indexes = {}
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def rpc(self, name: str, params: dict = None) -> FakeRPC:
+        return FakeRPC(self, name, params or {})
+
+    def reset_calls(self):
+        self.calls.clear()
+
+    def _next_id(self, table: str, key: str) -> int:
+        if not self._sequences[table]:
+            existing = [row[key] for row in self.tables.get(table, []) if isinstance(row.get(key), int)]
+            self._sequences[table] = max(existing, default=0)
+        self._sequences[table] += 1
+        return self._sequences[table]
+
+    def _round_trip(self, label: str):
+        self.calls[label] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _call(self, rpc: FakeRPC):
+        self._round_trip(f"rpc/{rpc.name}")
+        if rpc.name not in self.functions:
+            raise FakeAPIError(f"Could not find the function {rpc.name}", code="PGRST202")
+        with self._lock:
+            return FakeResponse(self.functions[rpc.name](self, **rpc.params))
+
+    def _execute(self, query: FakeQuery):
+        self._round_trip(query.table_name)
+        with self._lock:
+            rows = self.tables.setdefault(query.table_name, [])
+            if query._operation != "select":
+                self._indexes = {key: index for key, index in self._indexes.items() if key[0] != query.table_name}
+            if query._operation == "insert":
+                return FakeResponse(self._insert(query.table_name, rows, query._payload))
+            if query._operation == "upsert":
+                return FakeResponse(self._upsert(query, rows))
+            if query._operation == "update":
+                matched = [row for row in rows if query._matches(row)]
+                payload = {key: _normalize(value) for key, value in query._payload.items()}
+                self._check_unique(query.table_name, rows, matched, [{**row, **payload} for row in matched])
+                for row in matched:
+                    row.update(payload)
+                return FakeResponse([dict(row) for row in matched])
+            if query._operation == "delete":
+                matched = [row for row in rows if query._matches(row)]
+                self.tables[query.table_name] = [row for row in rows if not query._matches(row)]
+                return FakeResponse(matched)
+            return self._select(query, rows)
+
+    def _check_unique(self, table: str, rows: list, replaced: list, written: list):
+        """Raise like Postgres when written rows clash on a unique index; replaced are the rows they overwrite."""
+        if table not in self.unique_indexes:
+            return
+        columns, covers = self.unique_indexes[table]
+
+        def key(row):
+            values = tuple(row.get(column) for column in columns)
+            # NULLs never clash in a Postgres unique index
+            return None if None in values or not covers(row) else tuple(str(_normalize(value)) for value in values)
+
+        # Stored rows are already normalized, so a cheap first-column match narrows the scan
+        replaced_ids = {id(row) for row in replaced}
+        firsts = {row.get(columns[0]) for row in written}
+        taken = {key(row) for row in rows if row.get(columns[0]) in firsts and id(row) not in replaced_ids}
+        for row in written:
+            row_key = key(row)
+            if row_key is None:
+                continue
+            if row_key in taken:
+                raise FakeAPIError(f"duplicate key value violates unique constraint on {table} {columns}", code="23505")
+            taken.add(row_key)
+
+    def _insert(self, table, rows, payload):
+        key = PRIMARY_KEYS.get(table)
+        new_rows = [{column: _normalize(value) for column, value in row.items()}
+                    for row in (payload if isinstance(payload, list) else [payload])]
+        self._check_unique(table, rows, [], new_rows)
+        for row in new_rows:
+            if key and row.get(key) is None:
+                row[key] = self._next_id(table, key)
+            rows.append(row)
+        return [dict(row) for row in new_rows]
+
+    def _upsert(self, query, rows):
+        key = query._on_conflict or PRIMARY_KEYS.get(query.table_name)
+        by_key = {row.get(key): row for row in rows}
+        pairs = [(by_key.get(row.get(key)), {column: _normalize(value) for column, value in row.items()})
+                 for row in (query._payload if isinstance(query._payload, list) else [query._payload])]
+        self._check_unique(query.table_name, rows, [existing for existing, _ in pairs if existing is not None],
+                           [{**existing, **row} if existing is not None else row for existing, row in pairs])
+        written = []
+        for existing, row in pairs:
+            if existing is None:
+                written.extend(self._insert(query.table_name, rows, row))
+            else:
+                existing.update(row)
+                written.append(dict(existing))
+        return written
+
+    def _index(self, table: str, column: str) -> dict:
+        index = self._indexes.get((table, column))
+        if index is None:
+            index = {}
+            for row in self.tables.get(table, []):
+                index.setdefault(str(_normalize(row.get(column))), []).append(row)
+            self._indexes[(table, column)] = index
+        return index
+
+    def _candidates(self, query, rows):
+        # Hash lookup on the first eq() filter; the remaining filters still run on every candidate
+        if not query._equals:
+            return rows
+        column, value = query._equals[0]
+        return self._index(query.table_name, column).get(value, [])
+
+    def _project(self, table: str, row: dict, columns: str):
+        """Selected columns of row with embedded relations nested; None when an !inner embed has no match."""
+        projected = {}
+        for part in _split_columns(columns):
+            match = EMBEDDED.match(part)
+            if part == "*":
+                projected.update(row)
+            elif match is None:
+                projected[part] = row.get(part)
+            else:
+                relation, inner, nested = match.groups()
+                local, remote = FOREIGN_KEYS[(table, relation)]
+                targets = self._index(relation, remote).get(str(_normalize(row.get(local))), [])
+                child = self._project(relation, targets[0], nested) if targets else None
+                if child is None and inner:
+                    return None
+                projected[relation] = child
+        return projected
+
+    def _select(self, query, rows):
+        matched = [row for row in self._candidates(query, rows) if query._matches(row)]
+        for column, desc in reversed(query._orders):
+            matched.sort(key=lambda row: _order_key(row.get(column)), reverse=desc)
+        projected = [self._project(query.table_name, row, query._columns) for row in matched]
+        projected = [row for row in projected if row is not None]
+        count = len(projected) if query._count else None
+        if query._offset or query._limit is not None:
+            end = None if query._limit is None else query._offset + query._limit
+            projected = projected[query._offset:end]
+        data = [] if query._head else projected
+        if query._single:
+            if len(data) != 1:
+                raise FakeAPIError("JSON object requested, multiple (or no) rows returned")
+            return FakeResponse(data[0], count)
+        return FakeResponse(data, count)
+
+
+def get_available_seats(backend, flight_):
+    taken = {ticket["seat_number"] for ticket in backend.tables.get("ticket", [])
+             if ticket.get("flight_number") == flight_ and ticket.get("status") in ("active", "confirmed")}
+    return [{"seat_number": seat["seat_number"]} for seat in backend.tables.get("seat", [])
+            if seat.get("flight_id") == flight_ and seat["seat_number"] not in taken]
+
+
+def count_active_tickets(backend, flight_numbers):
+    wanted = set(flight_numbers)
+    counts = Counter(ticket["flight_number"] for ticket in backend.tables.get("ticket", [])
+                     if ticket.get("flight_number") in wanted and ticket.get("status") == "active")
+    return [{"flight_number": flight_number, "booked_seats": count} for flight_number, count in counts.items()]
+
+
+def count_changes_by_admin(backend):
+    counts = Counter(row["ssn"] for row in backend.tables.get("manage", []))
+    return [{"admin_ssn": ssn, "changes_count": count} for ssn, count in sorted(counts.items())]
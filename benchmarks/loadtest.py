@@ -0,0 +1,251 @@
+"""Offline load test for the API against the in-process Supabase stand-in.
+
+Runs each scenario with a fixed number of requests at a given concurrency and
+reports p50/p99 latency, throughput and Supabase round trips per request.
+The first request of every scenario runs alone on a cold cache and its round
+trips are deterministic, so --baseline fails CI when a change makes an
+endpoint issue more queries than the recorded baseline. The averaged
+figures depend on cache timing and are compared with a relative tolerance.
+Scenarios share warm caches, so compare runs made with the same options.
+
+    python benchmarks/loadtest.py
+    python benchmarks/loadtest.py --scenario booking_percentage --requests 500
+    python benchmarks/loadtest.py --write-baseline benchmarks/baseline.json
+    python benchmarks/loadtest.py --baseline benchmarks/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+
+import bench_env  # noqa: F401
+
+import httpx
+
+import datagen
+import main
+from fake_supabase import FakeSupabase
+
+
+class Context:
+    def __init__(self, tables: dict, seed: int):
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.flights = tables["flight"]
+        self.passengers = [row["ssn"] for row in tables["passenger"]]
+        self.planes = [row["registration_number"] for row in tables["plane"]]
+        self.next_ticket_id = max(row["ticket_id"] for row in tables["ticket"]) + 1
+        self.tokens = {}
+
+    def token(self, ssn: str) -> dict:
+        if ssn not in self.tokens:
+            self.tokens[ssn] = {"Authorization": "Bearer " + main.create_access_token({"sub": ssn})}
+        return self.tokens[ssn]
+
+    def admin(self) -> dict:
+        return self.token(datagen.ADMIN_SSN)
+
+    def employee(self) -> dict:
+        return self.token(datagen.EMPLOYEE_SSN)
+
+    def flight(self) -> dict:
+        return self.rng.choice(self.flights)
+
+
+def search_flights(ctx):
+    flight = ctx.flight()
+    return "GET", "/passenger/flights", {"params": {
+        "departure_city": flight["departure_city"], "destination_city": flight["destination_city"],
+        "travel_date": flight["date"]}}
+
+
+def available_seats(ctx):
+    return "GET", f"/available_seats/{ctx.flight()['flight_number']}", {}
+
+
+def book_seat(ctx):
+    ssn = ctx.rng.choice(ctx.passengers)
+    ctx.next_ticket_id += 1
+    ticket = {"ticket_id": ctx.next_ticket_id, "seat_number": None, "flight_number": ctx.flight()["flight_number"],
+              "payment_id": ctx.next_ticket_id, "passenger_id": ssn, "status": "active"}
+    return "POST", "/passenger/book_seat", {"json": ticket, "headers": ctx.token(ssn)}
+
+
+def booking_percentage(ctx):
+    return "GET", "/admin/reports/booking_percentage", {"params": {"flight_date": ctx.flight()["date"]}, "headers": ctx.admin()}
+
+
+def load_factor(ctx):
+    return "GET", "/admin/reports/load_factor", {"params": {"flight_date": ctx.flight()["date"]}, "headers": ctx.admin()}
+
+
+def confirmed_payments(ctx):
+    return "GET", "/admin/reports/payments", {"params": {"limit": 100}, "headers": ctx.admin()}
+
+
+def waitlisted_passengers(ctx):
+    return "GET", "/admin/reports/waitlisted_passengers", {"params": {"flight_number": ctx.flight()["flight_number"]}, "headers": ctx.admin()}
+
+
+def cancelled_tickets(ctx):
+    return "GET", "/admin/reports/ticket_cancelled", {"params": {"limit": 100}, "headers": ctx.admin()}
+
+
+def range_analytics(ctx):
+    return "GET", "/admin/reports/analytics", {"params": {
+        "start_date": ctx.flights[0]["date"], "end_date": ctx.flights[-1]["date"],
+        "group_by": ctx.rng.choice(["flight", "plane", "route", "day"])}, "headers": ctx.admin()}
+
+
+def changes_by_admin(ctx):
+    return "GET", "/admin/reports/changes_by_admin", {"headers": ctx.admin()}
+
+
+def maintenance(ctx):
+    return "GET", "/maintenance", {"params": {"plane_id": ctx.rng.choice(ctx.planes)}, "headers": ctx.employee()}
+
+
+def maintenance_last(ctx):
+    return "GET", "/maintenance/last", {"headers": ctx.employee()}
+
+
+SCENARIOS = {
+    "search_flights": search_flights,
+    "available_seats": available_seats,
+    "book_seat": book_seat,
+    "booking_percentage": booking_percentage,
+    "load_factor": load_factor,
+    "confirmed_payments": confirmed_payments,
+    "waitlisted_passengers": waitlisted_passengers,
+    "cancelled_tickets": cancelled_tickets,
+    "range_analytics": range_analytics,
+    "changes_by_admin": changes_by_admin,
+    "maintenance": maintenance,
+    "maintenance_last": maintenance_last,
+}
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+async def run_scenario(client, backend, ctx, name: str, requests: int, concurrency: int) -> dict:
+    # Untimed cold request first; its round-trip count is what the baseline pins exactly
+    ctx.rng.seed(f"{ctx.seed}:{name}")
+    calls_before = sum(backend.calls.values())
+    method, path, kwargs = SCENARIOS[name](ctx)
+    await client.request(method, path, **kwargs)
+    cold_calls = sum(backend.calls.values()) - calls_before
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one():
+        nonlocal errors
+        method, path, kwargs = SCENARIOS[name](ctx)
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.request(method, path, **kwargs)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+
+    calls_before = sum(backend.calls.values())
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    return {
+        "scenario": name,
+        "requests": requests,
+        "errors": errors,
+        "cold_calls": cold_calls,
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": percentile(latencies, 0.99),
+        "throughput_rps": requests / elapsed,
+        "calls_per_request": (sum(backend.calls.values()) - calls_before) / requests,
+    }
+
+
+async def run(args) -> list:
+    tables = datagen.generate(seed=args.seed, days=args.days, flights_per_day=args.flights_per_day)
+    backend = FakeSupabase(tables, latency=args.latency_ms / 1000)
+    main.supabase = backend
+    ctx = Context(tables, args.seed)
+
+    results = []
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+            while (await client.get("/readyz")).status_code != 200:
+                await asyncio.sleep(0.01)
+            for name in args.scenario or SCENARIOS:
+                results.append(await run_scenario(client, backend, ctx, name, args.requests, args.concurrency))
+    return results
+
+
+def check_baseline(results: list, path: str, tolerance: float, latency_tolerance: float = None) -> list:
+    with open(path) as f:
+        baseline = json.load(f)
+    regressions = []
+    for result in results:
+        expected = baseline.get(result["scenario"])
+        if expected is None:
+            continue
+        name = result["scenario"]
+        if result["cold_calls"] > expected["cold_calls"]:
+            regressions.append(f"{name}: {result['cold_calls']} round trips on a cold request, baseline {expected['cold_calls']}")
+        # Plus a tenth of a round trip so near-zero averages from cached endpoints do not flap
+        if result["calls_per_request"] > expected["calls_per_request"] * (1 + tolerance) + 0.1:
+            regressions.append(f"{name}: {result['calls_per_request']:.2f} round trips per request, "
+                               f"baseline {expected['calls_per_request']:.2f}")
+        if latency_tolerance is not None and result["p99_ms"] > expected["p99_ms"] * (1 + latency_tolerance):
+            regressions.append(f"{name}: p99 {result['p99_ms']:.1f} ms, baseline {expected['p99_ms']:.1f} ms")
+    return regressions
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="simulated Supabase round-trip time")
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--flights-per-day", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=321)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--baseline", help="fail if any scenario needs more round trips than this file records")
+    parser.add_argument("--write-baseline", help="record round trips and p99 latency to this file")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed relative increase in averaged round trips per request")
+    parser.add_argument("--latency-tolerance", type=float,
+                        help="allowed relative increase in p99 latency; latency is not checked unless set")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'scenario':<22}{'req':>6}{'err':>5}{'p50 ms':>9}{'p99 ms':>9}{'req/s':>9}{'cold':>6}{'calls/req':>11}")
+        for r in results:
+            print(f"{r['scenario']:<22}{r['requests']:>6}{r['errors']:>5}{r['p50_ms']:>9.1f}{r['p99_ms']:>9.1f}"
+                  f"{r['throughput_rps']:>9.1f}{r['cold_calls']:>6}{r['calls_per_request']:>11.2f}")
+
+    if args.write_baseline:
+        with open(args.write_baseline, "w") as f:
+            json.dump({r["scenario"]: {"cold_calls": r["cold_calls"], "calls_per_request": round(r["calls_per_request"], 2),
+                                       "p99_ms": round(r["p99_ms"], 1)} for r in results}, f, indent=2, sort_keys=True)
+            f.write("\n")
+    if args.baseline:
+        regressions = check_baseline(results, args.baseline, args.tolerance, args.latency_tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,96 @@
+"""Concurrent booking stress test for the seat inventory.
+
+Fires PASSENGERS parallel /passenger/book_seat requests (half of them asking
+for a specific seat) at a flight with SEATS seats, spread over --workers
+copies of the app. Each copy is main.py loaded as its own module, so it has
+its own seat inventory like a separate uvicorn worker, and all of them share
+one Supabase stand-in whose writes take WRITE_LATENCY seconds. The run fails
+if any seat was sold twice. --without-index drops the partial unique index
+from sql/ticket_seat_unique.sql to show what it prevents across workers.
+
+    python benchmarks/stress_seat_booking.py
+    python benchmarks/stress_seat_booking.py --workers 1
+    python benchmarks/stress_seat_booking.py --without-index
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib.util
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+import bench_env  # noqa: F401
+
+import httpx
+
+from fake_supabase import FakeSupabase
+
+SEATS = 60
+PASSENGERS = 200
+WRITE_LATENCY = 0.01
+FLIGHT = "SV100"
+MAIN_PATH = os.path.join(os.path.dirname(__file__), "..", "main.py")
+
+
+def load_worker(i: int):
+    spec = importlib.util.spec_from_file_location(f"worker{i}", MAIN_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+async def main_async(workers: int, unique_index: bool) -> bool:
+    seat_names = [f"{row}{letter}" for row in range(1, SEATS // 6 + 1) for letter in "ABCDEF"]
+    backend = FakeSupabase({"seat": [{"flight_id": FLIGHT, "seat_number": seat} for seat in seat_names], "ticket": []},
+                           latency=WRITE_LATENCY, unique_indexes=unique_index)
+    apps = [load_worker(i) for i in range(workers)]
+    for app in apps:
+        app.supabase = backend
+
+    headers = {}
+    for i in range(PASSENGERS):
+        ssn = str(i)
+        for app in apps:
+            app.principal_cache.put(ssn, app.User(ssn=ssn, username=ssn, email=f"{ssn}@example.com"), ["Passenger"])
+        headers[ssn] = {"Authorization": "Bearer " + apps[0].create_access_token({"sub": ssn})}
+
+    # Each worker's lifespan creates its own email outbox and token store
+    async with contextlib.AsyncExitStack() as stack:
+        for app in apps:
+            await stack.enter_async_context(app.app.router.lifespan_context(app.app))
+        return await run_bookings(apps, backend, headers, seat_names, workers)
+
+
+async def run_bookings(apps, backend, headers: dict, seat_names: list, workers: int) -> bool:
+    clients = [httpx.AsyncClient(transport=httpx.ASGITransport(app=app.app), base_url="http://stress") for app in apps]
+
+    async def book(i: int):
+        ssn = str(i)
+        seat = random.choice(seat_names) if i % 2 else None
+        ticket = {"ticket_id": i, "seat_number": seat, "flight_number": FLIGHT, "payment_id": i,
+                  "passenger_id": ssn, "status": "active"}
+        return await clients[i % workers].post("/passenger/book_seat", json=ticket, headers=headers[ssn])
+
+    start = time.perf_counter()
+    responses = await asyncio.gather(*(book(i) for i in range(PASSENGERS)))
+    elapsed = time.perf_counter() - start
+    for client in clients:
+        await client.aclose()
+
+    statuses = Counter(response.status_code for response in responses)
+    sold = Counter(ticket["seat_number"] for ticket in backend.tables["ticket"])
+    double_booked = [seat for seat, count in sold.items() if count > 1]
+    print(f"{PASSENGERS} requests over {workers} workers in {elapsed:.2f}s, statuses {dict(statuses)}")
+    print(f"seats sold {len(sold)}/{SEATS}, double-booked {len(double_booked)}")
+    return not double_booked and len(sold) == SEATS
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--without-index", action="store_true", help="do not enforce the partial unique index")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(main_async(args.workers, not args.without_index)) else 1)
@@ -1,26 +1,163 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from supabase import create_client, Client
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter
 from typing import List, Optional, Any
 from datetime import date
 from dotenv import load_dotenv
 from datetime import date, datetime, timedelta
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+import anyio
+import asyncio
+import bisect
+import contextvars
+import csv
+import hashlib
+import heapq
+import io
+import json
+import operator
 import secrets
+import sqlite3
+import threading
+import time
+import importlib
 import jwt
 
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 import os
 load_dotenv()
-app = FastAPI()
 
-# Initialize Supabase client
-url: str = os.environ.get("SUPABASE_URL")
-key: str = os.environ.get("SUPABASE_KEY")
-supabase: Client = create_client(url, key)
+# Clients and the SQLite-backed email outbox and token revocation store are
+# created in the lifespan handler instead of at import time, so importing main
+# opens no files, and supabase, sendgrid and numpy are imported when first
+# needed. A missing setting fails the worker at startup, not on the first
+# request. Startup does not wait for the caches: they are warmed in the
+# background, and /readyz reports ready once that is done. A client assigned
+# before startup (as the benchmarks do) is kept.
+supabase = None
+email_outbox = None
+token_revocations = None
+
+def create_supabase_client():
+    from supabase import create_client
+
+    url = os.environ.get("SUPABASE_URL")
+    key = os.environ.get("SUPABASE_KEY")
+    if not url or not key:
+        raise RuntimeError("SUPABASE_URL and SUPABASE_KEY must be set")
+    return create_client(url, key)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global supabase, email_outbox, token_revocations
+    if supabase is None:
+        supabase = create_supabase_client()
+    if email_outbox is None:
+        email_outbox = create_email_outbox()
+    if token_revocations is None:
+        token_revocations = TokenRevocationStore(TOKEN_REVOCATION_DB, TOKEN_REVOCATION_SWEEP_INTERVAL)
+    email_outbox.start()
+    token_revocations.start()
+    audit_log.start()
+    warmup.start()
+    try:
+        yield
+    finally:
+        await warmup.stop()
+        await audit_log.stop()
+        await token_revocations.stop()
+        email_outbox.stop()
+
+app = FastAPI(lifespan=lifespan)
+
+# Metrics: small Prometheus-style counters and histograms served at /metrics.
+# Every Supabase call made through execute() is timed per table and also
+# recorded on the current request, so N+1 patterns show up as calls per request.
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "0"))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple, buckets: tuple):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values: tuple, value: float):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, (bucket_counts, total, count) in sorted(self._series.items()):
+                labels = ",".join(f'{label}="{value}"' for label, value in zip(self.labels, label_values))
+                prefix = labels + "," if labels else ""
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {bucket_count}')
+                lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {count}')
+                lines.append(f"{self.name}_sum{{{labels}}} {total}")
+                lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return lines
+
+def render_metric(name: str, kind: str, help: str, samples: List[tuple]) -> List[str]:
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        label_text = ",".join(f'{label}="{label_value}"' for label, label_value in labels.items())
+        lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return lines
+
+request_duration = Histogram("http_request_duration_seconds", "Request latency by endpoint.", ("method", "route", "status"), LATENCY_BUCKETS)
+request_queries = Histogram("http_request_supabase_calls", "Supabase calls issued per request.", ("method", "route"), COUNT_BUCKETS)
+query_duration = Histogram("supabase_query_duration_seconds", "Supabase call latency by table.", ("table", "method"), LATENCY_BUCKETS)
+email_enqueue_duration = Histogram("email_enqueue_duration_seconds", "Time send_email spends queueing a message.", (), LATENCY_BUCKETS)
+email_send_duration = Histogram("email_send_duration_seconds", "Email sink latency per batched send.", (), LATENCY_BUCKETS)
+request_trace = contextvars.ContextVar("request_trace", default=None)
+
+def background_task(coro) -> asyncio.Task:
+    # Tasks copy the caller's context; start from an empty one so work spawned by a
+    # request is not counted in that request's trace
+    return contextvars.Context().run(asyncio.create_task, coro)
+
+def query_label(query) -> tuple:
+    request = getattr(query, "request", None)
+    path = str(getattr(request, "path", ""))
+    table = path.split("/rest/v1/", 1)[-1] or "unknown"
+    return table, getattr(request, "http_method", "GET")
+
+# Data access: blocking PostgREST calls run on a bounded worker pool so a slow
+# query never stalls the event loop. DB_CONCURRENCY caps in-flight calls.
+DB_CONCURRENCY = int(os.getenv("DB_CONCURRENCY", "32"))
+db_limiter = anyio.CapacityLimiter(DB_CONCURRENCY)
+
+async def execute(query):
+    start = time.perf_counter()
+    try:
+        return await anyio.to_thread.run_sync(query.execute, limiter=db_limiter)
+    finally:
+        elapsed = time.perf_counter() - start
+        label = query_label(query)
+        query_duration.observe(label, elapsed)
+        trace = request_trace.get()
+        if trace is not None:
+            trace.append((label, elapsed))
 
 # OAuth2 scheme for authentication
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -73,6 +210,16 @@ class AdminChanges(BaseModel):
     admin_ssn: str
     changes_count: int
 
+class TicketIds(BaseModel):
+    ticket_ids: List[int]
+
+class BulkItemResult(BaseModel):
+    index: int
+    ticket_id: Optional[int] = None
+    status_code: int
+    detail: Optional[str] = None
+    ticket: Optional[Ticket] = None
+
 class Maintenance(BaseModel):
     maintenance_id: Optional[int] = None
     plane_id: str
@@ -83,34 +230,348 @@ class Maintenance(BaseModel):
 
 
 
-def send_email(to_email: str, subject: str, content: str):
-    message = Mail(
-        from_email=FROM_EMAIL,
-        to_emails=to_email,
-        subject=subject,
-        html_content=content)
+# Email delivery sinks. The outbox hands each sink one message body and the list
+# of recipients that should receive it.
+class SendGridSink:
+    def __init__(self, api_key: str, from_email: str):
+        self.api_key = api_key
+        self.from_email = from_email
+        self.client = None
+
+    def send(self, to_emails: List[str], subject: str, content: str):
+        from sendgrid import SendGridAPIClient
+        from sendgrid.helpers.mail import Mail
+
+        if self.client is None:
+            self.client = SendGridAPIClient(self.api_key)
+        message = Mail(
+            from_email=self.from_email,
+            to_emails=to_emails,
+            subject=subject,
+            html_content=content,
+            is_multiple=True)
+        self.client.send(message)
+
+class LocalSink:
+    def __init__(self, max_messages: int = 1000):
+        self.messages = deque(maxlen=max_messages)
+
+    def send(self, to_emails: List[str], subject: str, content: str):
+        for to_email in to_emails:
+            self.messages.append({"to_email": to_email, "subject": subject, "content": content})
+
+def create_email_sink(kind: str):
+    if kind == "local":
+        return LocalSink()
+    return SendGridSink(SENDGRID_API_KEY, FROM_EMAIL)
+
+# Email outbox: messages are persisted to SQLite before the request returns and
+# drained by background workers, so a crash or restart does not lose mail.
+EMAIL_OUTBOX_DB = os.getenv("EMAIL_OUTBOX_DB", "email_outbox.sqlite3")
+EMAIL_SINK = os.getenv("EMAIL_SINK", "sendgrid")
+EMAIL_WORKERS = int(os.getenv("EMAIL_WORKERS", "2"))
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", "50"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "5"))
+EMAIL_RETRY_BASE = float(os.getenv("EMAIL_RETRY_BASE", "2"))
+EMAIL_POLL_INTERVAL = float(os.getenv("EMAIL_POLL_INTERVAL", "1"))
+EMAIL_CLAIM_LEASE = 60.0
+
+class EmailOutbox:
+    def __init__(self, path: str, sink, workers: int, batch_size: int, max_attempts: int, retry_base: float):
+        self.sink = sink
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.sent = 0
+        self.failed = 0
+        self._threads = []
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox_email ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, to_email TEXT NOT NULL, subject TEXT NOT NULL, "
+            "content TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "next_attempt_at REAL NOT NULL, claimed_until REAL NOT NULL DEFAULT 0)")
+
+    def enqueue(self, to_email: str, subject: str, content: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO outbox_email (to_email, subject, content, next_attempt_at) VALUES (?, ?, ?, ?)",
+                (to_email, subject, content, time.time()))
+        self._wakeup.set()
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outbox_email").fetchone()[0]
+
+    def start(self):
+        self._stopping.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"email-outbox-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        # Unsent rows stay in the outbox and are picked up on the next start
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def drain(self):
+        # Deliver everything that is due right now on the calling thread
+        while self._process_batch():
+            pass
+
+    def _claim_batch(self):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, to_email, subject, content, attempts FROM outbox_email "
+                    "WHERE next_attempt_at <= ? AND claimed_until <= ? ORDER BY id LIMIT ?",
+                    (now, now, self.batch_size)).fetchall()
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE outbox_email SET claimed_until = ? WHERE id IN ({','.join('?' * len(rows))})",
+                        (now + EMAIL_CLAIM_LEASE, *(row[0] for row in rows)))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return rows
+
+    def _process_batch(self) -> bool:
+        rows = self._claim_batch()
+        if not rows:
+            return False
+
+        # Identical notifications go out as one API call with one personalization per recipient
+        groups = {}
+        for row in rows:
+            groups.setdefault((row[2], row[3]), []).append(row)
+
+        for (subject, content), group in groups.items():
+            start = time.perf_counter()
+            try:
+                self.sink.send([row[1] for row in group], subject, content)
+            except Exception as e:
+                print(f"Email delivery failed: {e}")
+                self._retry(group)
+            else:
+                email_send_duration.observe((), time.perf_counter() - start)
+                self.sent += len(group)
+                with self._lock:
+                    self._conn.execute(
+                        f"DELETE FROM outbox_email WHERE id IN ({','.join('?' * len(group))})",
+                        [row[0] for row in group])
+        return True
+
+    def _retry(self, rows):
+        now = time.time()
+        with self._lock:
+            for row_id, _, _, _, attempts in rows:
+                attempts += 1
+                if attempts >= self.max_attempts:
+                    self.failed += 1
+                    self._conn.execute("DELETE FROM outbox_email WHERE id = ?", (row_id,))
+                else:
+                    self._conn.execute(
+                        "UPDATE outbox_email SET attempts = ?, next_attempt_at = ?, claimed_until = 0 WHERE id = ?",
+                        (attempts, now + self.retry_base ** attempts, row_id))
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                if self._process_batch():
+                    continue
+            except Exception as e:
+                print(f"Email outbox error: {e}")
+            self._wakeup.wait(EMAIL_POLL_INTERVAL)
+            self._wakeup.clear()
+
+def create_email_outbox() -> EmailOutbox:
+    return EmailOutbox(
+        EMAIL_OUTBOX_DB, create_email_sink(EMAIL_SINK), EMAIL_WORKERS,
+        EMAIL_BATCH_SIZE, EMAIL_MAX_ATTEMPTS, EMAIL_RETRY_BASE)
+
+async def send_email(to_email: str, subject: str, content: str):
+    # The INSERT can wait on the outbox workers or on another process's write lock, so keep it off the event loop
+    start = time.perf_counter()
+    await anyio.to_thread.run_sync(email_outbox.enqueue, to_email, subject, content)
+    email_enqueue_duration.observe((), time.perf_counter() - start)
+
+# Token revocation store, shared by all workers through a local SQLite file.
+# Tokens are keyed by their SHA-256 hash and dropped once their exp has passed.
+# Queries run in a worker thread because another process's write can hold the
+# file lock for up to the busy timeout; if it is still locked the request gets
+# a 503 rather than a crash. Expired tokens are swept by a background task.
+TOKEN_REVOCATION_DB = os.getenv("TOKEN_REVOCATION_DB", "token_revocations.sqlite3")
+TOKEN_REVOCATION_SWEEP_INTERVAL = float(os.getenv("TOKEN_REVOCATION_SWEEP_INTERVAL", "60"))
+
+class TokenRevocationStore:
+    def __init__(self, path: str, sweep_interval: float):
+        self.sweep_interval = sweep_interval
+        self._task = None
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS revoked_token ("
+            "token_hash TEXT PRIMARY KEY, expires_at REAL NOT NULL) WITHOUT ROWID")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS revoked_token_expires_at ON revoked_token (expires_at)")
+
+    @staticmethod
+    def _hash(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def revoke(self, token: str, expires_at: float):
+        if expires_at <= time.time():
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO revoked_token (token_hash, expires_at) VALUES (?, ?)",
+                (self._hash(token), expires_at))
+
+    def is_revoked(self, token: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM revoked_token WHERE token_hash = ? AND expires_at > ?",
+                (self._hash(token), time.time())).fetchone()
+        return row is not None
+
+    def sweep(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM revoked_token WHERE expires_at <= ?", (time.time(),))
+        return cursor.rowcount
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM revoked_token").fetchone()[0]
+
+    async def _run(self):
+        while True:
+            try:
+                await anyio.to_thread.run_sync(self.sweep)
+            except sqlite3.Error as e:
+                print(f"Token revocation sweep failed: {e}")
+            await asyncio.sleep(self.sweep_interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+# Utility function to add a token to the blacklist until it expires
+async def blacklist_token(token: str):
     try:
-        sg = SendGridAPIClient(SENDGRID_API_KEY)
-        response = sg.send(message)
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], options={"verify_exp": False})
+    except jwt.PyJWTError:
+        return
+    expires_at = payload.get("exp")
+    if expires_at is None:
+        expires_at = time.time() + timedelta(days=1).total_seconds()
+    try:
+        await anyio.to_thread.run_sync(token_revocations.revoke, token, float(expires_at))
+    except sqlite3.OperationalError as e:
+        print(f"Could not revoke token: {e}")
+        raise HTTPException(status_code=503, detail="Token store is busy, try again")
 
-    except Exception as e:
-        print(e.message)
+# Function to check if a token is blacklisted
+async def is_token_blacklisted(token: str) -> bool:
+    try:
+        return await anyio.to_thread.run_sync(token_revocations.is_revoked, token)
+    except sqlite3.OperationalError as e:
+        # Fail closed: a token that cannot be checked is not accepted
+        print(f"Could not check token revocation: {e}")
+        raise HTTPException(status_code=503, detail="Token store is busy, try again")
+
+# Principal cache: ssn -> (User, roles), bounded with TTL and LRU eviction
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "1024"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+
+class PrincipalCache:
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, ssn: str):
+        with self._lock:
+            entry = self._entries.get(ssn)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[ssn]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(ssn)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, ssn: str, user: User, roles: List[str]):
+        with self._lock:
+            self._entries[ssn] = (time.monotonic() + self.ttl, user, roles)
+            self._entries.move_to_end(ssn)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, ssn: Optional[str] = None):
+        # Call this whenever a person's roles change; no ssn clears everything
+        with self._lock:
+            if ssn is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(ssn, None)
 
-        
-# In-memory token blacklist
-token_blacklist = []
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
 
-# Utility function to add a token to the blacklist
-def blacklist_token(token: str):
-    token_blacklist.append(token)
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
 
-# Function to check if a token is blacklisted
-def is_token_blacklisted(token: str) -> bool:
-    return token in token_blacklist
+ROLE_TABLES = {"Admin": "admin", "Employee": "employee", "Passenger": "passenger"}
+
+def invalidate_principal(ssn: Optional[str] = None):
+    principal_cache.invalidate(ssn)
 
-# Override the get_current_user function to check the blacklist
-def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
-    if is_token_blacklisted(token):
+async def load_principal(ssn: str):
+    cached = principal_cache.get(ssn)
+    if cached is not None:
+        return cached
+
+    # Resolve the person and all three role tables concurrently instead of serially
+    user_data, *role_data = await asyncio.gather(
+        execute(supabase.table("person").select("ssn, username, email").eq("ssn", ssn)),
+        *(execute(supabase.table(table).select("ssn").eq("ssn", ssn)) for table in ROLE_TABLES.values()),
+    )
+    if not user_data.data:
+        raise HTTPException(status_code=401, detail="User not found")
+
+    user_info = user_data.data[0]
+    user = User(ssn=user_info["ssn"], username=user_info["username"], email=user_info["email"])
+    roles = [role for role, response in zip(ROLE_TABLES, role_data) if response.data]
+    principal_cache.put(ssn, user, roles)
+    return user, roles
+
+# Override the get_current_user function to check the blacklist. The user and
+# roles are resolved once per request; FastAPI caches the dependency, so
+# get_current_user and role_checker share one principal lookup.
+async def get_current_principal(token: str = Depends(oauth2_scheme)):
+    if await is_token_blacklisted(token):
         raise HTTPException(status_code=401, detail="Token has been invalidated")
 
     try:
@@ -121,26 +582,15 @@ def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    user_data = supabase.table("person").select("*").eq("ssn", ssn).execute()
-    if not user_data.data:
-        raise HTTPException(status_code=401, detail="User not found")
+    return await load_principal(ssn)
 
-    user_info = user_data.data[0]
-    return User(ssn=user_info["ssn"], username=user_info["username"], email=user_info["email"])
-
-def get_user_roles(user: User):
-    roles = []
-    if supabase.table("admin").select("ssn").eq("ssn", user.ssn).execute().data:
-        roles.append("Admin")
-    if supabase.table("employee").select("ssn").eq("ssn", user.ssn).execute().data:
-        roles.append("Employee")
-    if supabase.table("passenger").select("ssn").eq("ssn", user.ssn).execute().data:
-        roles.append("Passenger")
-    return roles
+async def get_current_user(principal=Depends(get_current_principal)) -> User:
+    user, _ = principal
+    return user
 
 def require_roles(required_roles: List[str]):
-    def role_checker(user: User = Depends(get_current_user)):
-        user_roles = get_user_roles(user)
+    async def role_checker(principal=Depends(get_current_principal)):
+        user, user_roles = principal
         if not any(role in user_roles for role in required_roles):
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient permissions")
         return user
@@ -157,48 +607,1329 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     return encoded_jwt
 
 
-def find_available_seat(flight_number: str):
-    query = """
-    SELECT s.seat_number
-    FROM seat s
-    LEFT JOIN ticket t ON s.seat_number = t.seat_number AND s.flight_id = t.flight_number AND t.status NOT IN ('active', 'waitlist')
-    WHERE s.flight_id = :flight_number AND t.seat_number IS NULL
-    LIMIT 1;
-    """
+# Seat inventory: per-flight seat map held in memory. taken is a bytearray
+# indexed by seat position and free is a stack of candidate positions, so
+# reserving or releasing a seat is O(1). Reservations happen without awaiting,
+# so two bookers on the same worker can never be handed the same seat. Across
+# workers the inventory can be stale, so the partial unique index in
+# sql/ticket_seat_unique.sql makes the ticket write the final check; a clash
+# comes back as a unique violation and is answered with a 409. A booking that
+# let us pick the seat is instead retried from the reloaded flight, up to
+# SEAT_RETRY_ATTEMPTS times. Flights without seats are not cached, and entries
+# unused for twice SEAT_INVENTORY_TTL are dropped unless they still hold
+# pending seats.
+SEAT_HOLDING_STATUSES = ("active", "confirmed")
+SEAT_INVENTORY_TTL = float(os.getenv("SEAT_INVENTORY_TTL", "300"))
+SEAT_RETRY_ATTEMPTS = int(os.getenv("SEAT_RETRY_ATTEMPTS", "3"))
+UNIQUE_VIOLATION_CODE = "23505"
+
+def seat_sort_key(seat_number: str):
+    return len(seat_number), seat_number
+
+class FlightSeats:
+    def __init__(self, seat_numbers: List[str], taken_seats: set):
+        self.seat_numbers = seat_numbers
+        self.positions = {seat_number: i for i, seat_number in enumerate(seat_numbers)}
+        self.taken = bytearray(len(seat_numbers))
+        for seat_number in taken_seats:
+            if seat_number in self.positions:
+                self.taken[self.positions[seat_number]] = 1
+        self.free_count = self.taken.count(0)
+        self.pending = set()
+        self.loaded_at = time.monotonic()
+        self.on_change = None
+        self._available = None
+        self._rebuild_free()
+
+    def _rebuild_free(self):
+        self.free = [i for i in reversed(range(len(self.seat_numbers))) if not self.taken[i]]
+
+    def reserve(self, seat_number: Optional[str] = None) -> Optional[str]:
+        if seat_number is None:
+            # Stale positions left behind by specific-seat reservations are skipped
+            while self.free:
+                position = self.free.pop()
+                if not self.taken[position]:
+                    break
+            else:
+                return None
+        else:
+            position = self.positions.get(seat_number)
+            if position is None or self.taken[position]:
+                return None
+        self.taken[position] = 1
+        self.free_count -= 1
+        self._available = None
+        seat_number = self.seat_numbers[position]
+        self.pending.add(seat_number)
+        if self.on_change is not None:
+            self.on_change(seat_number, False)
+        return seat_number
+
+    def release(self, seat_number: str) -> bool:
+        position = self.positions.get(seat_number)
+        if position is None or not self.taken[position]:
+            return False
+        self.taken[position] = 0
+        self.free_count += 1
+        self._available = None
+        self.pending.discard(seat_number)
+        self.free.append(position)
+        if len(self.free) > 2 * len(self.seat_numbers):
+            self._rebuild_free()
+        if self.on_change is not None:
+            self.on_change(seat_number, True)
+        return True
+
+    def confirm(self, seat_number: str):
+        self.pending.discard(seat_number)
+
+    def available(self) -> List[str]:
+        if self._available is None:
+            self._available = [seat for seat, taken in zip(self.seat_numbers, self.taken) if not taken]
+        return self._available
+
+class SeatInventory:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.flights = {}
+        self.listeners = []
+        self._locks = {}
+        self._swept_at = time.monotonic()
+
+    def _notify(self, flight_number: str, changes: Optional[dict]):
+        # changes maps seat_number -> available; None means the flight was invalidated
+        for listener in self.listeners:
+            listener(flight_number, changes)
+
+    def _fresh(self, flight_number: str) -> Optional[FlightSeats]:
+        seats = self.flights.get(flight_number)
+        if seats is not None and time.monotonic() - seats.loaded_at <= self.ttl:
+            return seats
+        return None
+
+    def _evict_expired(self):
+        # Watched flights are reloaded every TTL, so only unused entries get this old
+        now = time.monotonic()
+        if now - self._swept_at < self.ttl:
+            return
+        self._swept_at = now
+        for flight_number, seats in list(self.flights.items()):
+            if now - seats.loaded_at > 2 * self.ttl and not seats.pending:
+                del self.flights[flight_number]
+                lock = self._locks.get(flight_number)
+                if lock is not None and not lock.locked():
+                    del self._locks[flight_number]
+
+    async def get(self, flight_number: str) -> FlightSeats:
+        seats = self._fresh(flight_number)
+        if seats is not None:
+            return seats
+
+        self._evict_expired()
+        lock = self._locks.setdefault(flight_number, asyncio.Lock())
+        async with lock:
+            seats = await self._load(flight_number)
+        if flight_number not in self.flights and self._locks.get(flight_number) is lock:
+            del self._locks[flight_number]
+        return seats
+
+    async def _load(self, flight_number: str) -> FlightSeats:
+        seats = self._fresh(flight_number)
+        if seats is not None:
+            return seats
+        seats_response, tickets_response = await asyncio.gather(
+            execute(supabase.table("seat").select("seat_number").eq("flight_id", flight_number)),
+            execute(supabase.table("ticket").select("seat_number").eq("flight_number", flight_number)
+                    .in_("status", list(SEAT_HOLDING_STATUSES))),
+        )
+        seats = FlightSeats(
+            sorted({seat["seat_number"] for seat in seats_response.data}, key=seat_sort_key),
+            {ticket["seat_number"] for ticket in tickets_response.data if ticket["seat_number"]})
+        previous = self.flights.get(flight_number)
+        if not seats.seat_numbers and previous is None:
+            # Unknown flight: nothing to reserve, and caching it would let any path grow the map
+            return seats
+
+        # Seats handed out but not yet written back must stay taken across a reload
+        if previous is not None:
+            for seat_number in previous.pending:
+                seats.reserve(seat_number)
+        self.flights[flight_number] = seats
+        seats.on_change = lambda seat_number, available: self._notify(flight_number, {seat_number: available})
+
+        # A reload can pick up changes made elsewhere; listeners get them as one delta
+        if previous is not None:
+            before, after = set(previous.available()), set(seats.available())
+            changes = {seat_number: True for seat_number in after - before}
+            changes.update({seat_number: False for seat_number in before - after})
+            if changes:
+                self._notify(flight_number, changes)
+        return seats
+
+    async def reserve(self, flight_number: str, seat_number: Optional[str] = None) -> Optional[str]:
+        seats = await self.get(flight_number)
+        return seats.reserve(seat_number)
+
+    def release(self, flight_number: str, seat_number: Optional[str]):
+        seats = self.flights.get(flight_number)
+        if seats is not None and seat_number:
+            seats.release(seat_number)
+
+    def confirm(self, flight_number: str, seat_number: str):
+        seats = self.flights.get(flight_number)
+        if seats is not None:
+            seats.confirm(seat_number)
+
+    def invalidate(self, flight_number: Optional[str] = None):
+        # Forces a reload from the database on next use; pending seats are kept
+        flight_numbers = [flight_number] if flight_number else list(self.flights)
+        for flight_number in flight_numbers:
+            seats = self.flights.get(flight_number)
+            if seats is not None:
+                seats.loaded_at = float("-inf")
+                self._notify(flight_number, None)
+
+seat_inventory = SeatInventory(SEAT_INVENTORY_TTL)
+
+async def reserve_ticket_seat(ticket_data: dict):
+    # Take the ticket's seat (or the next free one) before the ticket is written
+    if ticket_data.get("status") not in SEAT_HOLDING_STATUSES:
+        return
+    try:
+        seat_number = await seat_inventory.reserve(ticket_data["flight_number"], ticket_data.get("seat_number"))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if seat_number is None:
+        raise HTTPException(status_code=409, detail="Seat is not available")
+    ticket_data["seat_number"] = seat_number
+
+def confirm_ticket_seat(ticket_data: dict):
+    if ticket_data.get("status") in SEAT_HOLDING_STATUSES:
+        seat_inventory.confirm(ticket_data["flight_number"], ticket_data["seat_number"])
+
+def release_ticket_seat(ticket_data: dict):
+    if ticket_data.get("status") in SEAT_HOLDING_STATUSES:
+        seat_inventory.release(ticket_data["flight_number"], ticket_data.get("seat_number"))
+
+def holds_same_seat(current: dict, ticket_data: dict) -> bool:
+    # An edit that keeps the ticket on its seat needs no new reservation
+    return (current.get("status") in SEAT_HOLDING_STATUSES and ticket_data.get("status") in SEAT_HOLDING_STATUSES
+            and current["flight_number"] == ticket_data["flight_number"]
+            and current.get("seat_number") == ticket_data.get("seat_number"))
+
+def ticket_write_error(e: Exception, reserved: Optional[dict] = None) -> HTTPException:
+    # Undo the reservation made for a failed ticket write and map the error to a response
+    if reserved is not None:
+        release_ticket_seat(reserved)
+    if getattr(e, "code", None) == UNIQUE_VIOLATION_CODE:
+        # Another worker booked the seat; reload the flight so later bookings see it
+        if reserved is not None:
+            seat_inventory.invalidate(reserved["flight_number"])
+        return HTTPException(status_code=409, detail="Seat is not available")
+    return HTTPException(status_code=400, detail=str(e))
+
+async def insert_ticket(ticket_data: dict) -> dict:
+    # Reserve a seat and write the ticket. When no seat was named, a clash only
+    # means this worker's inventory was stale, so the next free seat is tried.
+    pick_seat = not ticket_data.get("seat_number")
+    for attempt in range(SEAT_RETRY_ATTEMPTS):
+        await reserve_ticket_seat(ticket_data)
+        try:
+            response = await execute(supabase.table("ticket").insert(ticket_data))
+        except Exception as e:
+            error = ticket_write_error(e, ticket_data)
+            if not pick_seat or getattr(e, "code", None) != UNIQUE_VIOLATION_CODE or attempt == SEAT_RETRY_ATTEMPTS - 1:
+                raise error
+            ticket_data["seat_number"] = None
+            continue
+        report_cache.bump()
+        confirm_ticket_seat(ticket_data)
+        return response.data[0]
+
+async def write_ticket_rows(write, rows: List[dict]) -> List[tuple]:
+    # One (row, None) or (None, error) per row. A batch write is all-or-nothing, so
+    # after a seat clash each row is retried alone to find the ones that clash.
+    try:
+        return [(row, None) for row in (await execute(write(rows))).data]
+    except Exception as e:
+        if getattr(e, "code", None) != UNIQUE_VIOLATION_CODE or len(rows) == 1:
+            return [(None, e)] * len(rows)
+
+    async def write_one(row):
+        try:
+            return (await execute(write([row]))).data[0], None
+        except Exception as e:
+            return None, e
+    return await asyncio.gather(*(write_one(row) for row in rows))
+
+
+# Live seat availability over Server-Sent Events. Each flight has one hub
+# entry shared by all of its watchers. A watcher gets the inventory snapshot
+# when it connects and then the deltas published by reserve, release and
+# inventory reloads, so a thousand watchers cost one inventory load instead
+# of a thousand polls. A watcher that falls behind gets a fresh snapshot
+# instead of the backlog. While a flight has watchers it is reloaded every
+# SEAT_INVENTORY_TTL seconds, which picks up bookings made by other workers.
+SEAT_EVENTS_QUEUE_SIZE = int(os.getenv("SEAT_EVENTS_QUEUE_SIZE", "256"))
+SEAT_EVENTS_KEEPALIVE = float(os.getenv("SEAT_EVENTS_KEEPALIVE", "15"))
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+class SeatEventHub:
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.watchers = {}
+        self._refreshers = {}
+        self._tasks = set()
+
+    def watcher_count(self, flight_number: Optional[str] = None) -> int:
+        if flight_number is not None:
+            return len(self.watchers.get(flight_number, ()))
+        return sum(len(queues) for queues in self.watchers.values())
+
+    def seats_changed(self, flight_number: str, changes: Optional[dict]):
+        queues = self.watchers.get(flight_number)
+        if not queues:
+            return
+        if changes is None:
+            # Reload now so watchers see whatever caused the invalidation
+            task = background_task(self._reload(flight_number))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            return
+        for queue in queues:
+            if queue.full():
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+            else:
+                queue.put_nowait(changes)
+
+    async def _reload(self, flight_number: str):
+        try:
+            await seat_inventory.get(flight_number)
+        except Exception as e:
+            print(f"Could not reload seats for flight {flight_number}: {e}")
+
+    async def _refresh(self, flight_number: str):
+        while True:
+            await asyncio.sleep(seat_inventory.ttl)
+            await self._reload(flight_number)
+
+    def _subscribe(self, flight_number: str) -> asyncio.Queue:
+        queue = asyncio.Queue(self.queue_size)
+        queues = self.watchers.setdefault(flight_number, set())
+        queues.add(queue)
+        if flight_number not in self._refreshers:
+            self._refreshers[flight_number] = background_task(self._refresh(flight_number))
+        return queue
+
+    def _unsubscribe(self, flight_number: str, queue: asyncio.Queue):
+        queues = self.watchers.get(flight_number, set())
+        queues.discard(queue)
+        if not queues:
+            self.watchers.pop(flight_number, None)
+            refresher = self._refreshers.pop(flight_number, None)
+            if refresher is not None:
+                refresher.cancel()
+
+    def snapshot(self, flight_number: str, seats: FlightSeats) -> str:
+        return sse_event("snapshot", {"flight_number": flight_number, "available_seats": seats.available()})
+
+    async def events(self, flight_number: str):
+        # No await between loading the seats and subscribing, so no delta can fall in between
+        seats = await seat_inventory.get(flight_number)
+        queue = self._subscribe(flight_number)
+        try:
+            yield self.snapshot(flight_number, seats)
+            while True:
+                try:
+                    changes = await asyncio.wait_for(queue.get(), SEAT_EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if changes is None:
+                    yield self.snapshot(flight_number, await seat_inventory.get(flight_number))
+                    continue
+                yield sse_event("seats", {
+                    "flight_number": flight_number,
+                    "available": sorted((seat for seat, available in changes.items() if available), key=seat_sort_key),
+                    "taken": sorted((seat for seat, available in changes.items() if not available), key=seat_sort_key),
+                })
+        finally:
+            self._unsubscribe(flight_number, queue)
+
+seat_hub = SeatEventHub(SEAT_EVENTS_QUEUE_SIZE)
+seat_inventory.listeners.append(seat_hub.seats_changed)
+
+
+# Seat capacity index: registration_number -> total and per-class seat counts.
+# Fleet configuration rarely changes, so it is loaded at startup and refreshed
+# after CAPACITY_TTL seconds, for unknown planes, or on demand by an admin.
+# Plane ids that were looked up and not found are remembered until the next
+# full reload, so reports naming them do not query again.
+CAPACITY_TTL = float(os.getenv("CAPACITY_TTL", "3600"))
+
+class SeatCapacityIndex:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.planes = {}
+        self.missing = set()
+        self.version = 0
+        self.loaded_at = None
+        self._lock = asyncio.Lock()
+
+    def is_stale(self) -> bool:
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > self.ttl
+
+    def unknown(self, plane_ids: List[str]) -> List[str]:
+        return [plane_id for plane_id in set(plane_ids) if plane_id not in self.planes and plane_id not in self.missing]
+
+    async def refresh(self, plane_ids: Optional[List[str]] = None, force: bool = False):
+        async with self._lock:
+            # Callers that queued behind another refresh usually find the work already done
+            if not force:
+                if plane_ids is None and not self.is_stale():
+                    return
+                if plane_ids is not None:
+                    plane_ids = self.unknown(plane_ids)
+                    if not plane_ids:
+                        return
+
+            query = supabase.table("plane").select("registration_number, aircraft_id")
+            if plane_ids is not None:
+                query = query.in_("registration_number", list(set(plane_ids)))
+            planes = (await execute(query)).data
+
+            aircraft_ids = list({plane["aircraft_id"] for plane in planes})
+            seats_by_aircraft = {}
+            if aircraft_ids:
+                seats_response = await execute(
+                    supabase.table("aircraft_seatstype").select("aircraft_id, seat_type, number_of_seats")
+                    .in_("aircraft_id", aircraft_ids))
+                for seat in seats_response.data:
+                    classes = seats_by_aircraft.setdefault(seat["aircraft_id"], {})
+                    classes[seat["seat_type"]] = classes.get(seat["seat_type"], 0) + seat["number_of_seats"]
+
+            entries = {}
+            for plane in planes:
+                seats_by_class = seats_by_aircraft.get(plane["aircraft_id"], {})
+                entries[plane["registration_number"]] = {
+                    "aircraft_id": plane["aircraft_id"],
+                    "total_seats": sum(seats_by_class.values()),
+                    "seats_by_class": seats_by_class,
+                }
+
+            if plane_ids is None:
+                self.planes = entries
+                self.missing = set()
+                self.loaded_at = time.monotonic()
+            else:
+                planes = dict(self.planes)
+                for plane_id in plane_ids:
+                    planes.pop(plane_id, None)
+                planes.update(entries)
+                self.planes = planes
+                self.missing = (self.missing | set(plane_ids)) - set(entries)
+            self.version += 1
+
+    async def ensure_fresh(self, plane_ids: Optional[List[str]] = None):
+        if self.is_stale():
+            await self.refresh()
+        elif plane_ids and self.unknown(plane_ids):
+            await self.refresh(plane_ids)
+
+    def seat_counts(self, plane_ids: Optional[List[str]] = None) -> dict:
+        planes = self.planes
+        if plane_ids is None:
+            return {plane_id: entry["total_seats"] for plane_id, entry in planes.items()}
+        return {plane_id: planes[plane_id]["total_seats"] for plane_id in plane_ids if plane_id in planes}
+
+capacity_index = SeatCapacityIndex(CAPACITY_TTL)
+
+# Flight schedule index: (departure_city, destination_city) -> upcoming flights
+# sorted by date and time, so exact-date and date-range searches are bisects.
+# The whole schedule is reloaded after SCHEDULE_TTL seconds or once
+# invalidate() is called by anything that changes flights.
+SCHEDULE_TTL = float(os.getenv("SCHEDULE_TTL", "300"))
+
+def flight_sort_key(flight: dict):
+    return str(flight["date"]), str(flight["time"]), flight["flight_number"]
+
+class FlightScheduleIndex:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.routes = {}
+        self.loaded_at = None
+        self._lock = asyncio.Lock()
+
+    def is_stale(self) -> bool:
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > self.ttl
+
+    def invalidate(self):
+        self.loaded_at = None
+
+    async def refresh(self):
+        async with self._lock:
+            if not self.is_stale():
+                return
+            # Paged like the other full-table loads; one request would be cut off at PostgREST's max-rows
+            def build_query():
+                return supabase.table("flight").select(", ".join(model_columns(Flight))).gte("date", date.today())
+
+            flights = [flight async for flight in iterate_pages(build_query, "flight_number", None, PAGE_SIZE)]
+            routes = {}
+            for flight in sorted(flights, key=flight_sort_key):
+                flights, dates = routes.setdefault((flight["departure_city"], flight["destination_city"]), ([], []))
+                flights.append(flight)
+                dates.append(str(flight["date"]))
+            self.routes = routes
+            self.loaded_at = time.monotonic()
+
+    async def ensure_fresh(self):
+        if self.is_stale():
+            await self.refresh()
+
+    def search(self, departure_city: str, destination_city: str, start: date, end: date) -> List[dict]:
+        route = self.routes.get((departure_city, destination_city))
+        if route is None:
+            return []
+        flights, dates = route
+        low = bisect.bisect_left(dates, start.isoformat())
+        high = bisect.bisect_right(dates, end.isoformat())
+        return flights[low:high]
+
+schedule_index = FlightScheduleIndex(SCHEDULE_TTL)
+
+# Aggregates are pushed into Postgres, so reports receive one row per group
+# instead of one row per ticket. Grouped counts are the SQL functions in
+# sql/report_aggregates.sql called through rpc(). On a database without them,
+# up to AGGREGATE_HEAD_MAX_GROUPS groups are counted with one exact-count HEAD
+# request each; larger reports page through the one column being counted, so
+# round trips grow with the matching rows instead of with the groups. A
+# function found missing is not retried until the worker restarts.
+MISSING_FUNCTION_CODE = "PGRST202"
+AGGREGATE_HEAD_MAX_GROUPS = int(os.getenv("AGGREGATE_HEAD_MAX_GROUPS", "20"))
+IN_FILTER_CHUNK = 200
+missing_aggregates = set()
+
+async def count_rows(query) -> int:
+    response = await execute(query)
+    return response.count or 0
+
+async def count_values(build_query, column: str) -> Counter:
+    # Offset pages ordered by the counted column: rows with equal values may swap
+    # across a page boundary, which cannot change the counts, so no unique key is needed
+    counts = Counter()
+    offset = 0
+    while True:
+        rows = (await execute(build_query().order(column).range(offset, offset + MAX_PAGE_SIZE - 1))).data
+        counts.update(row[column] for row in rows)
+        if len(rows) < MAX_PAGE_SIZE:
+            return counts
+        offset += MAX_PAGE_SIZE
+
+async def call_aggregate(name: str, params: dict) -> Optional[List[dict]]:
+    if name in missing_aggregates:
+        return None
+    try:
+        response = await execute(supabase.rpc(name, params))
+    except Exception as e:
+        if getattr(e, "code", None) != MISSING_FUNCTION_CODE:
+            raise
+        print(f"Aggregate function {name} is not deployed, falling back to count requests")
+        missing_aggregates.add(name)
+        return None
+    return response.data
+
+# Bulk report helpers: each table is read once per report and joined in memory
+async def fetch_seat_counts(plane_ids: Optional[List[str]] = None) -> dict:
+    await capacity_index.ensure_fresh(plane_ids)
+    return capacity_index.seat_counts(plane_ids)
+
+async def fetch_active_ticket_counts(flight_numbers: List[str]) -> dict:
+    flight_numbers = sorted(set(flight_numbers))
+    if not flight_numbers:
+        return Counter()
+    rows = await call_aggregate("count_active_tickets", {"flight_numbers": flight_numbers})
+    if rows is not None:
+        return Counter({row["flight_number"]: row["booked_seats"] for row in rows})
+
+    if len(flight_numbers) <= AGGREGATE_HEAD_MAX_GROUPS:
+        counts = await asyncio.gather(*(
+            count_rows(supabase.table("ticket").select("ticket_id", count="exact", head=True)
+                       .eq("flight_number", flight_number).eq("status", "active"))
+            for flight_number in flight_numbers))
+        return Counter(dict(zip(flight_numbers, counts)))
+
+    # Large in_ lists are split so the request URL stays bounded; chunks run concurrently
+    def chunk_query(chunk):
+        return lambda: supabase.table("ticket").select("flight_number").in_("flight_number", chunk).eq("status", "active")
+    chunks = [flight_numbers[i:i + IN_FILTER_CHUNK] for i in range(0, len(flight_numbers), IN_FILTER_CHUNK)]
+    return sum(await asyncio.gather(*(count_values(chunk_query(chunk), "flight_number") for chunk in chunks)), Counter())
+
+async def fetch_admin_change_counts() -> List[dict]:
+    rows = await call_aggregate("count_changes_by_admin", {})
+    if rows is not None:
+        return rows
+
+    admins_response = await execute(supabase.table("admin").select("ssn"))
+    admin_ssns = sorted(admin["ssn"] for admin in admins_response.data)
+    if len(admin_ssns) <= AGGREGATE_HEAD_MAX_GROUPS:
+        counts = await asyncio.gather(*(
+            count_rows(supabase.table("manage").select("ssn", count="exact", head=True).eq("ssn", ssn))
+            for ssn in admin_ssns))
+    else:
+        changes = await count_values(lambda: supabase.table("manage").select("ssn"), "ssn")
+        counts = [changes[ssn] for ssn in admin_ssns]
+    return [{"admin_ssn": ssn, "changes_count": changes_count}
+            for ssn, changes_count in zip(admin_ssns, counts) if changes_count]
+
+# Date-range analytics. Per-flight capacity and bookings are laid out as NumPy
+# columns and reduced per group with bincount instead of Python loops. Grouped
+# by flight every row is its own group, so there is nothing to reduce and one
+# pass over the sorted rows is faster. The aggregation runs in a worker thread
+# so a year of flights does not stall the event loop.
+ANALYTICS_GROUPS = {
+    "flight": ("flight_number", "date"),
+    "plane": ("plane_id",),
+    "route": ("departure_city", "destination_city"),
+    "day": ("date",),
+}
+ANALYTICS_FIELDS = ("flights", "total_seats", "booked_seats", "load_factor", "booking_percentage")
+ANALYTICS_MAX_DAYS = int(os.getenv("ANALYTICS_MAX_DAYS", "731"))
+
+def flight_loads(flights: List[dict], seat_counts: dict, booked_counts: dict) -> Optional[List[dict]]:
+    # None when a (flight_number, date) repeats and rows have to be summed after all
+    key_of = lambda flight: (str(flight["flight_number"]), str(flight["date"]))
+    rows = []
+    previous = None
+    for flight in sorted(flights, key=key_of):
+        key = key_of(flight)
+        if key == previous:
+            return None
+        previous = key
+        total = seat_counts.get(flight["plane_id"], 0)
+        booked = booked_counts.get(flight["flight_number"], 0)
+        percentage = booked * 100 / total if total else 0.0
+        rows.append({"flight_number": flight["flight_number"], "date": flight["date"], "flights": 1, "total_seats": total,
+                     "booked_seats": booked, "load_factor": percentage, "booking_percentage": percentage})
+    return rows
+
+def aggregate_flight_loads(flights: List[dict], seat_counts: dict, booked_counts: dict, group_by: str) -> List[dict]:
+    import numpy as np
+
+    columns = ANALYTICS_GROUPS[group_by]
+    count = len(flights)
+    if not count:
+        return []
+    if group_by == "flight":
+        rows = flight_loads(flights, seat_counts, booked_counts)
+        if rows is not None:
+            return rows
+
+    total = np.fromiter((seat_counts.get(flight["plane_id"], 0) for flight in flights), dtype=np.float64, count=count)
+    booked = np.fromiter((booked_counts.get(flight["flight_number"], 0) for flight in flights), dtype=np.float64, count=count)
+    percentage = np.divide(booked * 100, total, out=np.zeros(count), where=total > 0)
+
+    # Factorize group keys to integer codes, then every aggregate is one bincount
+    codes = {}
+    key_of = operator.itemgetter(*columns)
+    inverse = np.fromiter((codes.setdefault(key_of(flight), len(codes)) for flight in flights), dtype=np.intp, count=count)
+    groups = [key if len(columns) > 1 else (key,) for key in codes]
+    flights_per_group = np.bincount(inverse)
+    seats_per_group = np.bincount(inverse, weights=total)
+    booked_per_group = np.bincount(inverse, weights=booked)
+    load_factor = np.divide(booked_per_group * 100, seats_per_group, out=np.zeros(len(groups)), where=seats_per_group > 0)
+    booking_percentage = np.bincount(inverse, weights=percentage) / flights_per_group
+
+    order = sorted(range(len(groups)), key=lambda i: tuple(map(str, groups[i])))
+    return [
+        {
+            **dict(zip(columns, groups[i])),
+            "flights": int(flights_per_group[i]),
+            "total_seats": int(seats_per_group[i]),
+            "booked_seats": int(booked_per_group[i]),
+            "load_factor": float(load_factor[i]),
+            "booking_percentage": float(booking_percentage[i]),
+        }
+        for i in order
+    ]
+
+async def fetch_range_analytics(start_date: date, end_date: date, group_by: str) -> List[dict]:
+    build_query = lambda: supabase.table("flight").select(
+        "flight_number, plane_id, departure_city, destination_city, date").gte("date", start_date).lte("date", end_date)
+    flights = [flight async for flight in iterate_pages(build_query, "flight_number", None, PAGE_SIZE)]
+    seat_counts, booked_counts = await asyncio.gather(
+        fetch_seat_counts([flight["plane_id"] for flight in flights]),
+        fetch_active_ticket_counts([flight["flight_number"] for flight in flights]),
+    )
+    return await anyio.to_thread.run_sync(aggregate_flight_loads, flights, seat_counts, booked_counts, group_by)
+
+async def csv_lines(rows: List[dict], columns: List[str]):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+# Waitlist promotion: a cancellation schedules a promotion run for its flight.
+# Each flight has one lock, so only one promoter at a time looks at its queue,
+# and a run only promotes as many tickets as the inventory has free seats.
+# Queued requests for a flight that is already waiting to run are coalesced.
+# A flight's lock is dropped once nothing holds or waits for it and no run is
+# queued, so the map only holds flights with promotion work in flight.
+WAITLIST_STATUS = "waitlisted"
+PROMOTED_STATUS = "active"
+
+class WaitlistPromoter:
+    def __init__(self):
+        self.promoted = 0
+        self._locks = {}
+        self._users = Counter()
+        self._queued = set()
+        self._tasks = set()
+
+    def schedule(self, flight_number: str):
+        if flight_number in self._queued:
+            return
+        self._queued.add(flight_number)
+        task = background_task(self._run(flight_number))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def wait_idle(self):
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    @asynccontextmanager
+    async def _locked(self, flight_number: str):
+        lock = self._locks.setdefault(flight_number, asyncio.Lock())
+        self._users[flight_number] += 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._users[flight_number] -= 1
+            if not self._users[flight_number]:
+                del self._users[flight_number]
+                if flight_number not in self._queued:
+                    del self._locks[flight_number]
+
+    async def _run(self, flight_number: str):
+        async with self._locked(flight_number):
+            self._queued.discard(flight_number)
+            try:
+                await self._promote(flight_number)
+            except Exception as e:
+                print(f"Waitlist promotion for flight {flight_number} failed: {e}")
+
+    async def promote(self, flight_number: str) -> List[dict]:
+        async with self._locked(flight_number):
+            return await self._promote(flight_number)
+
+    async def _promote(self, flight_number: str) -> List[dict]:
+        seats = await seat_inventory.get(flight_number)
+        if seats.free_count == 0:
+            return []
+
+        # Oldest bookings first, never more than the free seats; emails come embedded
+        waitlisted_response = await execute(
+            supabase.table("ticket").select(with_person("ticket_id", "email")).eq("flight_number", flight_number).eq("status", WAITLIST_STATUS)
+            .order("date_of_booking").order("ticket_id").limit(seats.free_count))
+        # The inventory may have reloaded during the select; reserve on the current one
+        seats = await seat_inventory.get(flight_number)
+        assignments = []
+        emails = {}
+        for ticket in waitlisted_response.data:
+            seat_number = seats.reserve()
+            if seat_number is None:
+                break
+            person = pop_person(ticket)
+            if person is not None:
+                emails[ticket["ticket_id"]] = person["email"]
+            assignments.append((ticket["ticket_id"], seat_number))
+        if not assignments:
+            return []
 
+        # Each update only applies while the ticket is still waitlisted, so a ticket
+        # cancelled or edited since the select above is left alone and its seat freed
+        async def assign(ticket_id, seat_number):
+            try:
+                response = await execute(
+                    supabase.table("ticket").update({"status": PROMOTED_STATUS, "seat_number": seat_number})
+                    .eq("ticket_id", ticket_id).eq("status", WAITLIST_STATUS))
+            except Exception as e:
+                return e
+            return response.data[0] if response.data else None
+
+        outcomes = await asyncio.gather(*(assign(ticket_id, seat_number) for ticket_id, seat_number in assignments))
+        promoted = []
+        errors = []
+        for (ticket_id, seat_number), outcome in zip(assignments, outcomes):
+            # The inventory may have reloaded during the writes, so go through it rather than seats
+            if isinstance(outcome, dict):
+                seat_inventory.confirm(flight_number, seat_number)
+                promoted.append(outcome)
+            else:
+                seat_inventory.release(flight_number, seat_number)
+                if isinstance(outcome, Exception):
+                    errors.append(outcome)
+        if promoted:
+            report_cache.bump()
+        self.promoted += len(promoted)
+
+        for ticket in promoted:
+            if ticket["ticket_id"] in emails:
+                await send_email(emails[ticket["ticket_id"]], "Ticket Confirmed",
+                                 f"Your ticket for flight {flight_number} has been confirmed with seat {ticket['seat_number']}")
+        clashed = any(getattr(error, "code", None) == UNIQUE_VIOLATION_CODE for error in errors)
+        if clashed:
+            # Another worker took one of these seats; the next run starts from a reloaded inventory
+            seat_inventory.invalidate(flight_number)
+        if errors and not promoted:
+            if clashed:
+                raise HTTPException(status_code=409, detail="Seat is not available") from errors[0]
+            raise errors[0]
+        for error in errors:
+            print(f"Could not promote a waitlisted ticket on flight {flight_number}: {error}")
+        return promoted
+
+waitlist_promoter = WaitlistPromoter()
+
+
+# Admin audit log. Admin ticket changes are buffered in memory and written to
+# manage in batches of AUDIT_BATCH_SIZE or every AUDIT_FLUSH_INTERVAL seconds,
+# whichever comes first, and shutdown writes whatever is left. A failed write
+# keeps its rows for the next flush, up to AUDIT_MAX_BUFFERED rows.
+# Per-admin totals start from the database counts and are incremented as
+# changes are recorded. They are reloaded after AUDIT_COUNTS_TTL seconds so
+# changes made by other workers show up.
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "100"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "5"))
+AUDIT_MAX_BUFFERED = int(os.getenv("AUDIT_MAX_BUFFERED", "10000"))
+AUDIT_COUNTS_TTL = float(os.getenv("AUDIT_COUNTS_TTL", "300"))
+
+class AdminAuditLog:
+    def __init__(self, batch_size: int, flush_interval: float, max_buffered: int, counts_ttl: float):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.counts_ttl = counts_ttl
+        self.buffer = []
+        self.in_flight = []
+        self.counts = Counter()
+        self.counts_loaded_at = None
+        self.written = 0
+        self.dropped = 0
+        self._flush_lock = asyncio.Lock()
+        self._counts_lock = asyncio.Lock()
+        self._flush_task = None
+        self._timer = None
+
+    def record(self, ssn: str, action: str, ticket_ids: List[int]):
+        changed_at = datetime.utcnow().isoformat()
+        for ticket_id in ticket_ids:
+            self.buffer.append({"ssn": ssn, "ticket_id": ticket_id, "action": action, "changed_at": changed_at})
+        self.counts[ssn] += len(ticket_ids)
+
+        overflow = len(self.buffer) - self.max_buffered
+        if overflow > 0:
+            print(f"Audit buffer full, dropping {overflow} oldest events")
+            del self.buffer[:overflow]
+            self.dropped += overflow
+        if len(self.buffer) >= self.batch_size and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = background_task(self.flush())
+
+    async def flush(self):
+        async with self._flush_lock:
+            while self.buffer:
+                batch = self.buffer[:self.batch_size]
+                del self.buffer[:len(batch)]
+                self.in_flight = batch
+                try:
+                    await execute(supabase.table("manage").insert(batch))
+                except Exception as e:
+                    print(f"Could not write {len(batch)} audit events: {e}")
+                    self.buffer[:0] = batch
+                    return
+                finally:
+                    self.in_flight = []
+                self.written += len(batch)
+
+    async def change_counts(self) -> List[dict]:
+        if self.counts_loaded_at is None or time.monotonic() - self.counts_loaded_at > self.counts_ttl:
+            async with self._counts_lock:
+                if self.counts_loaded_at is None or time.monotonic() - self.counts_loaded_at > self.counts_ttl:
+                    # No flush may finish mid-read, or its events would be in neither count
+                    async with self._flush_lock:
+                        rows = await fetch_admin_change_counts()
+                        counts = Counter({row["admin_ssn"]: row["changes_count"] for row in rows})
+                        # Events still in memory are not in the database counts yet
+                        for event in self.buffer + self.in_flight:
+                            counts[event["ssn"]] += 1
+                    self.counts = counts
+                    self.counts_loaded_at = time.monotonic()
+        return [{"admin_ssn": ssn, "changes_count": count} for ssn, count in sorted(self.counts.items()) if count]
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        self._timer = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        await self.flush()
+
+audit_log = AdminAuditLog(AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL, AUDIT_MAX_BUFFERED, AUDIT_COUNTS_TTL)
+
+
+# Admin report cache keyed by path and query string. Ticket and payment
+# writes bump the data version, which drops every cached report; entries also
+# expire after REPORT_CACHE_TTL so writes made by other workers show up.
+# Responses carry a content-hash ETag and If-None-Match hits return 304.
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", "256"))
+REPORT_CACHE_TTL = float(os.getenv("REPORT_CACHE_TTL", "30"))
+
+class ReportCache:
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def bump(self):
+        self.version += 1
+        self._entries.clear()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1:]
+
+    def put(self, key, version: int, etag: str, body: bytes, headers: dict):
+        # A write that landed while the report was computed makes it stale already
+        if version != self.version:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, etag, body, headers)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses, "version": self.version}
+
+report_cache = ReportCache(REPORT_CACHE_SIZE, REPORT_CACHE_TTL)
+
+async def cached_report(request: Request, response: Response, compute):
+    key = (request.url.path, tuple(sorted(request.query_params.multi_items())))
+    entry = report_cache.get(key)
+    if entry is None:
+        version = report_cache.version
+        data = await compute()
+        if isinstance(data, Response):
+            return data
+        body = dump_json(data)
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        headers = {name: value for name, value in response.headers.items() if name.startswith("x-")}
+        report_cache.put(key, version, etag, body, headers)
+    else:
+        etag, body, headers = entry
+
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers={"ETag": etag, **headers})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag, **headers})
+
+
+# Idempotency keys for booking and payment POSTs. A request with an
+# Idempotency-Key header runs once per user, path and key. A duplicate that
+# arrives while the first is still running waits for its result; one that
+# arrives later gets the stored result with Idempotent-Replayed: true and
+# does not touch Supabase. Reusing a key with a different body is a 422.
+# Failures are not stored, so a retry after an error runs again. Each worker
+# keeps up to IDEMPOTENCY_MAX_KEYS keys for IDEMPOTENCY_TTL seconds.
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+class IdempotencyEntry:
+    def __init__(self, fingerprint: str, expires_at: float):
+        self.fingerprint = fingerprint
+        self.expires_at = expires_at
+        self.result = None
+        self.completed = False
+        self.done = asyncio.Event()
+
+class IdempotencyStore:
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.replays = 0
+        self._entries = OrderedDict()
+
+    def get(self, key: tuple) -> Optional[IdempotencyEntry]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        return entry
+
+    def begin(self, key: tuple, fingerprint: str) -> IdempotencyEntry:
+        entry = IdempotencyEntry(fingerprint, time.monotonic() + self.ttl)
+        self._entries[key] = entry
+        excess = len(self._entries) - self.max_size
+        if excess > 0:
+            # Evict the oldest finished entries; an in-flight one has waiters that would run the request again
+            evicted = []
+            for old_key, old_entry in self._entries.items():
+                if len(evicted) == excess:
+                    break
+                if old_entry.completed:
+                    evicted.append(old_key)
+            for old_key in evicted:
+                del self._entries[old_key]
+        return entry
+
+    def complete(self, entry: IdempotencyEntry, result):
+        entry.result = result
+        entry.completed = True
+        entry.done.set()
+
+    def abandon(self, key: tuple, entry: IdempotencyEntry):
+        if self._entries.get(key) is entry:
+            del self._entries[key]
+        entry.done.set()
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "replays": self.replays}
+
+idempotency_store = IdempotencyStore(IDEMPOTENCY_MAX_KEYS, IDEMPOTENCY_TTL)
+
+async def idempotent(request: Request, response: Response, user: User, compute):
+    key = request.headers.get("idempotency-key")
+    if key is None:
+        return await compute()
+    if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1 to {IDEMPOTENCY_KEY_MAX_LENGTH} characters")
+
+    scope = (user.ssn, request.url.path, key)
+    fingerprint = hashlib.sha256(await request.body()).hexdigest()
+    while True:
+        entry = idempotency_store.get(scope)
+        if entry is None:
+            break
+        if entry.fingerprint != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+        if entry.completed:
+            idempotency_store.replays += 1
+            response.headers["Idempotent-Replayed"] = "true"
+            return entry.result
+        # If the first request fails the entry is dropped and this one runs instead
+        await entry.done.wait()
+
+    entry = idempotency_store.begin(scope, fingerprint)
     try:
-        response = supabase.rpc("query", {"query": query, "flight_number": flight_number}).execute()
-        return response.data[0]["seat_number"]
+        result = await compute()
+    except BaseException:
+        idempotency_store.abandon(scope, entry)
+        raise
+    idempotency_store.complete(entry, result)
+    return result
+
+
+# Keyset pagination and NDJSON streaming for list endpoints. Without limit,
+# after or stream an endpoint returns the full list as before; with limit it
+# returns one page ordered by key and sets X-Next-Cursor when more may follow;
+# with stream=true it pages through Supabase and yields one JSON row per line.
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "500"))
+MAX_PAGE_SIZE = 1000
+
+async def fetch_page(build_query, key: str, after, limit: int) -> List[dict]:
+    query = build_query()
+    if after is not None:
+        query = query.gt(key, after)
+    return (await execute(query.order(key).limit(limit))).data
+
+async def iterate_pages(build_query, key: str, after, page_size: int, expand=None):
+    while True:
+        rows = await fetch_page(build_query, key, after, page_size)
+        if not rows:
+            return
+        last_key = rows[-1][key]
+        for row in (await expand(rows) if expand else rows):
+            yield row
+        if len(rows) < page_size:
+            return
+        after = last_key
+
+async def ndjson_lines(rows):
+    async for row in rows:
+        yield dump_json(row) + b"\n"
+
+async def list_response(response: Response, build_query, key: str, after, limit: Optional[int], stream: bool, expand=None):
+    if stream:
+        rows = iterate_pages(build_query, key, after, limit or PAGE_SIZE, expand)
+        return StreamingResponse(ndjson_lines(rows), media_type="application/x-ndjson")
+
+    try:
+        if limit is None and after is None:
+            rows = (await execute(build_query())).data
+        else:
+            limit = limit or PAGE_SIZE
+            rows = await fetch_page(build_query, key, after, limit)
+            if len(rows) == limit:
+                response.headers["X-Next-Cursor"] = str(rows[-1][key])
+        return await expand(rows) if expand else rows
     except Exception as e:
-        raise HTTPException(status_code=400, detail=e.message)
+        raise HTTPException(status_code=400, detail=str(e))
 
+# Column projection and fast JSON for hot reads. Endpoints select only the
+# columns their response model declares, and fields= narrows that further for
+# sparse responses. Rows that come back with exactly the selected columns are
+# already in response shape, so they are encoded straight to JSON (orjson when
+# installed) instead of being validated again through the response model.
+def model_columns(model) -> List[str]:
+    return list(model.model_fields)
+
+def select_columns(model, fields: Optional[str] = None) -> List[str]:
+    columns = model_columns(model)
+    if not fields:
+        return columns
+    requested = list(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+    unknown = [field for field in requested if field not in columns]
+    if unknown or not requested:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}; allowed: {', '.join(columns)}")
+    return requested
+
+def shape_rows(rows: List[dict], columns: List[str], model) -> List[dict]:
+    expected = set(columns)
+    if all(row.keys() == expected for row in rows):
+        return rows
+    # Rows carry other columns (an index holding extra data, or a schema change)
+    if columns == model_columns(model):
+        adapter = TypeAdapter(List[model])
+        return adapter.dump_python(adapter.validate_python(rows), mode="json")
+    return [{column: row.get(column) for column in columns} for row in rows]
+
+def dump_json(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, default=str)
+    return json.dumps(data, default=str, separators=(",", ":")).encode()
+
+def json_rows(response: Response, rows: List[dict], columns: List[str], model) -> Response:
+    # Returning a Response skips response_model, so carry over headers such as X-Next-Cursor
+    headers = {name: value for name, value in response.headers.items() if name.startswith("x-")}
+    return Response(content=dump_json(shape_rows(rows, columns, model)), media_type="application/json", headers=headers)
+
+
+# Resource embedding: PostgREST follows ticket.passenger_id -> passenger ->
+# person and nests the related rows in each ticket, so a ticket list with its
+# passengers' details is one request. With inner=True tickets without a
+# matching person are dropped by the database, like an inner join.
+PERSON_COLUMNS = "ssn, first_name, father_name, family, email, phone"
+
+def with_person(columns: str, person_columns: str = PERSON_COLUMNS, inner: bool = False) -> str:
+    join = "!inner" if inner else ""
+    return f"{columns}, passenger{join}(person{join}({person_columns}))"
+
+def pop_person(ticket: dict) -> Optional[dict]:
+    passenger = ticket.pop("passenger", None) or {}
+    return passenger.get("person")
+
+async def distinct_persons(tickets: List[dict]) -> List[dict]:
+    persons = {}
+    for ticket in tickets:
+        person = pop_person(ticket)
+        if person is not None:
+            persons.setdefault(person["ssn"], person)
+    return list(persons.values())
+
+
+# Latest maintenance per plane, built with one paged scan and then kept up to
+# date by create_maintenance. A full rebuild happens after MAINTENANCE_INDEX_TTL
+# so records written by other workers are picked up.
+MAINTENANCE_INDEX_TTL = float(os.getenv("MAINTENANCE_INDEX_TTL", "600"))
+MAINTENANCE_COLUMNS = "plane_id, maintenance_id, employee_id, maintenance_type, maintenance_date, notes"
+
+def maintenance_sort_key(record: dict):
+    return str(record["maintenance_date"]), record.get("maintenance_id") or 0
+
+class LatestMaintenanceIndex:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.latest = {}
+        self.loaded_at = None
+        self._lock = asyncio.Lock()
+
+    def is_stale(self) -> bool:
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > self.ttl
+
+    async def refresh(self):
+        async with self._lock:
+            if not self.is_stale():
+                return
+            latest = {}
+            build_query = lambda: supabase.table("maintenance").select(MAINTENANCE_COLUMNS)
+            async for record in iterate_pages(build_query, "maintenance_id", None, PAGE_SIZE):
+                current = latest.get(record["plane_id"])
+                if current is None or maintenance_sort_key(record) > maintenance_sort_key(current):
+                    latest[record["plane_id"]] = record
+            self.latest = latest
+            self.loaded_at = time.monotonic()
+
+    async def ensure_fresh(self):
+        if self.is_stale():
+            await self.refresh()
+
+    def record(self, record: dict):
+        current = self.latest.get(record["plane_id"])
+        if current is None or maintenance_sort_key(record) >= maintenance_sort_key(current):
+            self.latest[record["plane_id"]] = record
+
+    def get(self, plane_ids: Optional[List[str]] = None) -> List[dict]:
+        if plane_ids is None:
+            records = list(self.latest.values())
+        else:
+            records = [self.latest[plane_id] for plane_id in plane_ids if plane_id in self.latest]
+        return sorted(records, key=maintenance_sort_key, reverse=True)
+
+latest_maintenance = LatestMaintenanceIndex(MAINTENANCE_INDEX_TTL)
+
+
+# Bulk ticket helpers: one write for the whole batch, one result per item and
+# one summary email per recipient instead of one per ticket.
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "500"))
+
+def check_bulk_size(items: list):
+    if not items:
+        raise HTTPException(status_code=400, detail="At least one ticket is required")
+    if len(items) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_ITEMS} tickets can be sent at once")
+
+async def send_summary_email(to_email: str, subject: str, lines: List[str]):
+    if lines:
+        await send_email(to_email, subject, "<br>".join(lines))
+
+async def bulk_insert_tickets(tickets: List[Ticket], user: User, check_owner: bool) -> List[BulkItemResult]:
+    check_bulk_size(tickets)
+    results = [None] * len(tickets)
+    rows = []
+    positions = []
+    picked = set()
+    for i, ticket in enumerate(tickets):
+        if check_owner and ticket.passenger_id != user.ssn:
+            results[i] = BulkItemResult(index=i, status_code=403, detail="You do not have permission to add a ticket for another passenger")
+            continue
+        ticket_data = ticket.model_dump(exclude={"ticket_id"})
+        if not ticket_data.get("seat_number"):
+            picked.add(i)
+        try:
+            await reserve_ticket_seat(ticket_data)
+        except HTTPException as e:
+            results[i] = BulkItemResult(index=i, status_code=e.status_code, detail=e.detail)
+            continue
+        rows.append(ticket_data)
+        positions.append(i)
+
+    if rows:
+        outcomes = await write_ticket_rows(lambda batch: supabase.table("ticket").insert(batch), rows)
+        booked = []
+        for ticket_data, i, (inserted, error) in zip(rows, positions, outcomes):
+            if error is not None:
+                clashed = getattr(error, "code", None) == UNIQUE_VIOLATION_CODE
+                error = ticket_write_error(error, ticket_data)
+                if clashed and i in picked:
+                    # The seat was ours to pick, so book it again alone from the reloaded flight
+                    ticket_data["seat_number"] = None
+                    try:
+                        inserted = await insert_ticket(ticket_data)
+                    except HTTPException as e:
+                        error = e
+                    else:
+                        booked.append(ticket_data)
+                        results[i] = BulkItemResult(index=i, ticket_id=inserted["ticket_id"], status_code=201, ticket=inserted)
+                        continue
+                results[i] = BulkItemResult(index=i, status_code=error.status_code, detail=error.detail)
+                continue
+            confirm_ticket_seat(ticket_data)
+            booked.append(ticket_data)
+            results[i] = BulkItemResult(index=i, ticket_id=inserted["ticket_id"], status_code=201, ticket=inserted)
+        if booked:
+            report_cache.bump()
+            await send_summary_email(user.email, "Tickets Booked", [
+                f"Ticket for flight {ticket_data['flight_number']} has been booked successfully" for ticket_data in booked])
+    return results
+
+
+async def update_ticket(ticket_id: int, current: dict, ticket: Ticket, user: User, message: str) -> dict:
+    # Reserve the new seat before the write and give the old one back after it
+    ticket_data = ticket.model_dump()
+    moved = not holds_same_seat(current, ticket_data)
+    if moved:
+        await reserve_ticket_seat(ticket_data)
+    try:
+        response = await execute(supabase.table("ticket").update(ticket_data).eq("ticket_id", ticket_id))
+        report_cache.bump()
+    except Exception as e:
+        raise ticket_write_error(e, ticket_data if moved else None)
+    if not response.data:
+        if moved:
+            release_ticket_seat(ticket_data)
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    if moved:
+        confirm_ticket_seat(ticket_data)
+        release_ticket_seat(current)
+    await send_email(user.email, "Ticket Updated", message)
+    return response.data[0]
 
 
 # Passenger functions
 @app.post("/passenger/ticket", response_model=Ticket)
-async def add_ticket(ticket: Ticket, user: User = Depends(require_roles(["Passenger"]))):
+async def add_ticket(request: Request, response: Response, ticket: Ticket, user: User = Depends(require_roles(["Passenger"]))):
     if ticket.passenger_id != user.ssn:
         raise HTTPException(status_code=403, detail="You do not have permission to add a ticket for another passenger")
-    ticket_data = ticket.model_dump(exclude={"ticket_id"})
-    try:
-        response = supabase.table("ticket").insert(ticket_data).execute()
-        send_email(user.email, "Ticket Booked", f"Ticket for flight {ticket.flight_number} has been booked successfully")
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=e.message)
-    return response.data[0]
+
+    async def compute():
+        ticket_data = ticket.model_dump(exclude={"ticket_id"})
+        inserted = await insert_ticket(ticket_data)
+        await send_email(user.email, "Ticket Booked", f"Ticket for flight {ticket.flight_number} has been booked successfully")
+        return inserted
+
+    return await idempotent(request, response, user, compute)
 
 @app.delete("/passenger/ticket/{ticket_id}")
 async def remove_ticket(ticket_id: int, user: User = Depends(require_roles(["Passenger"]))):
     # Ensure the ticket belongs to the current user via the ticket table
-    ticket_data = supabase.table("ticket").select("*").eq("ticket_id", ticket_id).eq("passenger_id", user.ssn).execute()
+    ticket_data = await execute(supabase.table("ticket").select("ticket_id, flight_number, seat_number, status").eq("ticket_id", ticket_id).eq("passenger_id", user.ssn))
     if not ticket_data.data:
         raise HTTPException(status_code=403, detail="You do not have permission to remove this ticket")
 
 
     try:
-        response = supabase.table("ticket").update({"status": "removed"}).eq("ticket_id", ticket_id).execute()
+        response = await execute(supabase.table("ticket").update({"status": "removed"}).eq("ticket_id", ticket_id))
+        report_cache.bump()
+        release_ticket_seat(ticket_data.data[0])
         flight_number = ticket_data.data[0]["flight_number"]
-        send_email(user.email, "Ticket Cancelled", f"Your ticket for flight {flight_number} has been cancelled")
+        waitlist_promoter.schedule(flight_number)
+        await send_email(user.email, "Ticket Cancelled", f"Your ticket for flight {flight_number} has been cancelled")
         return {"message": "Ticket removed"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=e.message)
@@ -207,370 +1938,522 @@ async def remove_ticket(ticket_id: int, user: User = Depends(require_roles(["Pas
 @app.put("/passenger/ticket/{ticket_id}", response_model=Ticket)
 async def edit_ticket(ticket_id: int, ticket: Ticket, user: User = Depends(require_roles(["Passenger"]))):
     # Ensure the ticket belongs to the current user via the ticket table
-    ticket_data = supabase.table("ticket").select("*").eq("ticket_id", ticket_id).eq("passenger_id", user.ssn).execute()
+    ticket_data = await execute(supabase.table("ticket").select("ticket_id, flight_number, seat_number, status").eq("ticket_id", ticket_id).eq("passenger_id", user.ssn))
     if not ticket_data.data:
         raise HTTPException(status_code=403, detail="You do not have permission to edit this ticket")
 
 
-    try:
-        response = supabase.table("ticket").update(ticket.model_dump()).eq("ticket_id", ticket_id).execute()
-        send_email(user.email, "Ticket Updated", f"Your ticket for flight {ticket.flight_number} has been updated")
-    except:
-        raise HTTPException(status_code=400, detail=e.message)
+    return await update_ticket(ticket_id, ticket_data.data[0], ticket, user, f"Your ticket for flight {ticket.flight_number} has been updated")
 
-    return response.data[0]
 
+@app.post("/passenger/tickets/bulk", response_model=List[BulkItemResult])
+async def add_tickets_bulk(tickets: List[Ticket], user: User = Depends(require_roles(["Passenger"]))):
+    return await bulk_insert_tickets(tickets, user, check_owner=True)
 
-@app.get("/passenger/flights", response_model=List[Flight])
-async def search_flights(departure_city: str, destination_city: str, travel_date: date):
+
+def validate_flight_search(departure_city: str, destination_cities: List[str], travel_date: date):
     if travel_date < date.today():
         raise HTTPException(status_code=400, detail="Travel date cannot be in the past")
-    if departure_city == destination_city:
+    if departure_city in destination_cities:
         raise HTTPException(status_code=400, detail="Departure and destination cities cannot be the same")
-    if not departure_city or not destination_city:
+    if not departure_city or not destination_cities or not all(destination_cities):
         raise HTTPException(status_code=400, detail="Departure and destination cities are required")
     if not travel_date:
         raise HTTPException(status_code=400, detail="Travel date is required")
+
+async def search_schedule(response: Response, departure_city: str, destination_cities: List[str],
+                          travel_date: date, days: int, offset: int, limit: int, fields: Optional[str]):
+    columns = select_columns(Flight, fields)
+    validate_flight_search(departure_city, destination_cities, travel_date)
     try:
-        response = supabase.table("flight").select("*").eq("departure_city", departure_city).eq("destination_city", destination_city).eq("date", travel_date).execute()
+        await schedule_index.ensure_fresh()
     except Exception as e:
-        raise HTTPException(status_code=400, detail=e.message)
-
-    return response.data
+        raise HTTPException(status_code=400, detail=str(e))
 
-@app.post("/passenger/book_seat", response_model=Ticket)
-async def book_seat(ticket: Ticket, user: User = Depends(require_roles(["Passenger"]))):
+    start = max(travel_date - timedelta(days=days), date.today())
+    end = travel_date + timedelta(days=days)
+    flights = list(heapq.merge(
+        *(schedule_index.search(departure_city, destination_city, start, end) for destination_city in destination_cities),
+        key=flight_sort_key))
+    response.headers["X-Total-Count"] = str(len(flights))
+    return json_rows(response, flights[offset:offset + limit], columns, Flight)
 
+@app.get("/passenger/flights", response_model=List[Flight])
+async def search_flights(response: Response, departure_city: str, destination_city: str, travel_date: date,
+                         fields: Optional[str] = None):
+    columns = select_columns(Flight, fields)
+    validate_flight_search(departure_city, [destination_city], travel_date)
     try:
+        await schedule_index.ensure_fresh()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        response = supabase.table("ticket").insert(ticket.model_dump()).execute()
-    
-        send_email(user.email, "Seat Booked", f"Your seat {ticket.seat_number} for flight {ticket.flight_number} has been booked successfully")
+    return json_rows(response, schedule_index.search(departure_city, destination_city, travel_date, travel_date), columns, Flight)
 
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=e.message)
-    return response.data[0]
+@app.get("/passenger/flights/flexible", response_model=List[Flight])
+async def search_flights_flexible(response: Response, departure_city: str, destination_city: str, travel_date: date,
+                                  days: int = Query(3, ge=0, le=30), offset: int = Query(0, ge=0),
+                                  limit: int = Query(50, ge=1, le=500), fields: Optional[str] = None):
+    return await search_schedule(response, departure_city, [destination_city], travel_date, days, offset, limit, fields)
+
+@app.get("/passenger/flights/multi", response_model=List[Flight])
+async def search_flights_multi(response: Response, departure_city: str, travel_date: date,
+                               destination_city: List[str] = Query(...), days: int = Query(0, ge=0, le=30),
+                               offset: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=500),
+                               fields: Optional[str] = None):
+    return await search_schedule(response, departure_city, destination_city, travel_date, days, offset, limit, fields)
+
+@app.post("/passenger/book_seat", response_model=Ticket)
+async def book_seat(request: Request, response: Response, ticket: Ticket, user: User = Depends(require_roles(["Passenger"]))):
+    async def compute():
+        ticket_data = ticket.model_dump()
+        inserted = await insert_ticket(ticket_data)
+        await send_email(user.email, "Seat Booked", f"Your seat {ticket_data['seat_number']} for flight {ticket.flight_number} has been booked successfully")
+        return inserted
+
+    return await idempotent(request, response, user, compute)
 
 @app.post("/passenger/payment", response_model=Payment)
-async def do_payment(payment: Payment, user: User = Depends(require_roles(["Passenger"]))):
-    payment_data = payment.model_dump(exclude={"payment_id"})
-    try:
-        response = supabase.table("payment").insert(payment_data).execute()
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=e.message)
-    return response.data[0]
+async def do_payment(request: Request, response: Response, payment: Payment, user: User = Depends(require_roles(["Passenger"]))):
+    async def compute():
+        payment_data = payment.model_dump(exclude={"payment_id"})
+        try:
+            response = await execute(supabase.table("payment").insert(payment_data))
+            report_cache.bump()
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return response.data[0]
+
+    return await idempotent(request, response, user, compute)
 
 # Admin functions
 @app.post("/admin/ticket", response_model=Ticket)
-async def add_ticket_admin(ticket: Ticket, user: User = Depends(require_roles(["Admin"]))):
-    ticket_data = ticket.model_dump(exclude={"ticket_id"})
-    try:
-        response = supabase.table("ticket").insert(ticket_data).execute()
-        send_email(user.email, "Ticket Booked", f"Ticket for flight {ticket.flight_number} has been booked successfully")
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=e.message)
-    return response.data[0]
+async def add_ticket_admin(request: Request, response: Response, ticket: Ticket, user: User = Depends(require_roles(["Admin"]))):
+    async def compute():
+        ticket_data = ticket.model_dump(exclude={"ticket_id"})
+        inserted = await insert_ticket(ticket_data)
+        audit_log.record(user.ssn, "add", [inserted["ticket_id"]])
+        await send_email(user.email, "Ticket Booked", f"Ticket for flight {ticket.flight_number} has been booked successfully")
+        return inserted
+
+    return await idempotent(request, response, user, compute)
 
 @app.delete("/admin/ticket/{ticket_id}")
 async def remove_ticket_admin(ticket_id: int, user: User = Depends(require_roles(["Admin"]))):
     
     try:
-        response = supabase.table("ticket").update({"status": "removed"}).eq("ticket_id", ticket_id).execute()
+        response = await execute(supabase.table("ticket").update({"status": "removed"}).eq("ticket_id", ticket_id))
+        report_cache.bump()
     except Exception as e:
         raise HTTPException(status_code=400, detail=e.message)
 
-    send_email(user.email, "Ticket Cancelled", f"Ticket for flight {ticket_id} has been cancelled")
+    # The seat is held by whatever status the ticket had before, so resync the flight
+    for removed in response.data:
+        seat_inventory.invalidate(removed["flight_number"])
+        waitlist_promoter.schedule(removed["flight_number"])
+    audit_log.record(user.ssn, "remove", [removed["ticket_id"] for removed in response.data])
+
+    await send_email(user.email, "Ticket Cancelled", f"Ticket for flight {ticket_id} has been cancelled")
 
     return {"message": "Ticket removed"}
 
 @app.put("/admin/ticket/{ticket_id}", response_model=Ticket)
 async def edit_ticket_admin(ticket_id: int, ticket: Ticket, user: User = Depends(require_roles(["Admin"]))):
     try:
-        response = supabase.table("ticket").update(ticket.model_dump()).eq("ticket_id", ticket_id).execute()
+        ticket_data = await execute(supabase.table("ticket").select("ticket_id, flight_number, seat_number, status").eq("ticket_id", ticket_id))
     except Exception as e:
-        raise HTTPException(status_code=400, detail=e.message)
-    send_email(user.email, "Ticket Updated", f"Ticket for flight {ticket.flight_number} has been updated")
-    return response.data[0]
-
-@app.put("/admin/promote_waitlisted/{ticket_id}")
-async def promote_waitlisted(ticket_id: str, user: User = Depends(require_roles(["Admin"]))):
-    # Update the status of the ticket to active
+        raise HTTPException(status_code=400, detail=str(e))
+    if not ticket_data.data:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+
+    updated = await update_ticket(ticket_id, ticket_data.data[0], ticket, user, f"Ticket for flight {ticket.flight_number} has been updated")
+    audit_log.record(user.ssn, "edit", [ticket_id])
+    return updated
+
+@app.post("/admin/tickets/bulk", response_model=List[BulkItemResult])
+async def add_tickets_admin_bulk(tickets: List[Ticket], user: User = Depends(require_roles(["Admin"]))):
+    results = await bulk_insert_tickets(tickets, user, check_owner=False)
+    audit_log.record(user.ssn, "add", [result.ticket_id for result in results if result.status_code == 201])
+    return results
+
+@app.put("/admin/tickets/bulk", response_model=List[BulkItemResult])
+async def edit_tickets_admin_bulk(tickets: List[Ticket], user: User = Depends(require_roles(["Admin"]))):
+    check_bulk_size(tickets)
+    ticket_ids = [ticket.ticket_id for ticket in tickets]
     try:
-        response = supabase.table("ticket").update({"status": "active"}).eq("ticket_id", ticket_id).execute()
+        existing_response = await execute(supabase.table("ticket").select("ticket_id, flight_number, seat_number, status").in_("ticket_id", ticket_ids))
     except Exception as e:
-        raise HTTPException(status_code=400, detail=e.message)
-    
-    # Get the passenger's email
+        raise HTTPException(status_code=400, detail=str(e))
+    existing = {ticket["ticket_id"]: ticket for ticket in existing_response.data}
+
+    # Update every known ticket in one upsert keyed on ticket_id; moved tickets reserve their new seat first
+    results = [None] * len(tickets)
+    rows = []
+    positions = []
+    seen = set()
+    for i, ticket in enumerate(tickets):
+        if ticket.ticket_id not in existing:
+            results[i] = BulkItemResult(index=i, ticket_id=ticket.ticket_id, status_code=404, detail="Ticket not found")
+            continue
+        if ticket.ticket_id in seen:
+            results[i] = BulkItemResult(index=i, ticket_id=ticket.ticket_id, status_code=400, detail="Duplicate ticket in request")
+            continue
+        seen.add(ticket.ticket_id)
+        ticket_data = ticket.model_dump()
+        if not holds_same_seat(existing[ticket.ticket_id], ticket_data):
+            try:
+                await reserve_ticket_seat(ticket_data)
+            except HTTPException as e:
+                results[i] = BulkItemResult(index=i, ticket_id=ticket.ticket_id, status_code=e.status_code, detail=e.detail)
+                continue
+        rows.append(ticket_data)
+        positions.append(i)
+
+    if rows:
+        outcomes = await write_ticket_rows(lambda batch: supabase.table("ticket").upsert(batch, on_conflict="ticket_id"), rows)
+        updated = []
+        for ticket_data, i, (row, error) in zip(rows, positions, outcomes):
+            current = existing[ticket_data["ticket_id"]]
+            moved = not holds_same_seat(current, ticket_data)
+            if error is not None:
+                error = ticket_write_error(error, ticket_data if moved else None)
+                results[i] = BulkItemResult(index=i, ticket_id=ticket_data["ticket_id"], status_code=error.status_code, detail=error.detail)
+                continue
+            if moved:
+                confirm_ticket_seat(ticket_data)
+                release_ticket_seat(current)
+            updated.append(ticket_data)
+            results[i] = BulkItemResult(index=i, ticket_id=ticket_data["ticket_id"], status_code=200, ticket=row)
+        if updated:
+            report_cache.bump()
+            audit_log.record(user.ssn, "edit", [row["ticket_id"] for row in updated])
+            await send_summary_email(user.email, "Tickets Updated", [
+                f"Ticket for flight {row['flight_number']} has been updated" for row in updated])
+    return results
+
+@app.post("/admin/tickets/bulk_cancel", response_model=List[BulkItemResult])
+async def remove_tickets_admin_bulk(body: TicketIds, user: User = Depends(require_roles(["Admin"]))):
+    check_bulk_size(body.ticket_ids)
     try:
-        passenger_data = supabase.table("passenger").select("*").eq("ssn", response.data[0]["passenger_id"]).execute()
+        response = await execute(supabase.table("ticket").update({"status": "removed"}).in_("ticket_id", body.ticket_ids))
+        report_cache.bump()
     except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    removed = {ticket["ticket_id"]: ticket for ticket in response.data}
+
+    for flight_number in {ticket["flight_number"] for ticket in removed.values()}:
+        seat_inventory.invalidate(flight_number)
+        waitlist_promoter.schedule(flight_number)
+    audit_log.record(user.ssn, "remove", list(removed))
+    await send_summary_email(user.email, "Tickets Cancelled", [
+        f"Ticket {ticket_id} for flight {ticket['flight_number']} has been cancelled" for ticket_id, ticket in removed.items()])
+
+    return [
+        BulkItemResult(index=i, ticket_id=ticket_id, status_code=200, ticket=removed[ticket_id])
+        if ticket_id in removed else
+        BulkItemResult(index=i, ticket_id=ticket_id, status_code=404, detail="Ticket not found")
+        for i, ticket_id in enumerate(body.ticket_ids)
+    ]
 
-        raise HTTPException(status_code=400, detail=e.message)
-    send_email(passenger_data.data[0]["email"], "Ticket Confirmed", f"Your ticket for flight {response.data[0]['flight_number']} has been confirmed")
+@app.put("/admin/promote_waitlisted/{ticket_id}")
+async def promote_waitlisted(ticket_id: str, user: User = Depends(require_roles(["Admin"]))):
+    # Update the status of the ticket to active and get the passenger's email at the same time
+    try:
+        response, person_response = await asyncio.gather(
+            execute(supabase.table("ticket").update({"status": "active"}).eq("ticket_id", ticket_id)),
+            execute(supabase.table("ticket").select(with_person("ticket_id", "email")).eq("ticket_id", ticket_id)),
+        )
+        report_cache.bump()
+    except Exception as e:
+        raise ticket_write_error(e)
+    if not response.data:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+
+    seat_inventory.invalidate(response.data[0]["flight_number"])
+    audit_log.record(user.ssn, "promote", [response.data[0]["ticket_id"]])
+    person = pop_person(person_response.data[0]) if person_response.data else None
+    if person is not None:
+        await send_email(person["email"], "Ticket Confirmed", f"Your ticket for flight {response.data[0]['flight_number']} has been confirmed")
     return {"message": "Passenger promoted"}
 
-@app.get("/admin/reports/active_flights", response_model=List[Flight])
-async def active_flights(user: User = Depends(require_roles(["Admin"]))):
+@app.post("/admin/waitlist/{flight_number}/promote", response_model=List[Ticket])
+async def promote_waitlist(flight_number: str, user: User = Depends(require_roles(["Admin"]))):
     try:
-        response = supabase.table("flight").select("*").eq("date", date.today()).execute()
+        promoted = await waitlist_promoter.promote(flight_number)
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=400, detail=e.message)
-    return response.data
+        raise HTTPException(status_code=400, detail=str(e))
+    audit_log.record(user.ssn, "promote", [ticket["ticket_id"] for ticket in promoted])
+    return promoted
+
+@app.get("/admin/reports/active_flights", response_model=List[Flight])
+async def active_flights(request: Request, response: Response, fields: Optional[str] = None,
+                         user: User = Depends(require_roles(["Admin"]))):
+    columns = select_columns(Flight, fields)
+
+    async def compute():
+        try:
+            flights_response = await execute(supabase.table("flight").select(", ".join(columns)).eq("date", date.today()))
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return shape_rows(flights_response.data, columns, Flight)
+
+    return await cached_report(request, response, compute)
 
 
 @app.get("/admin/reports/booking_percentage")
-async def booking_percentage(flight_date: date, user: User = Depends(require_roles(["Admin"]))):
-    try:
-        # Fetch flights on the given date
-        flights_response = supabase.table("flight").select("flight_number, plane_id").eq("date", flight_date).execute()
-
-        flights_data = flights_response.data
-        booking_percentages = []
-
-        for flight in flights_data:
-            flight_number = flight["flight_number"]
-            plane_id = flight["plane_id"]
-
-            # Fetch total seats for the plane
-            plane_response = supabase.table("plane").select("aircraft_id").eq("registration_number", plane_id).single().execute()
-        
-            aircraft_id = plane_response.data["aircraft_id"]
-            seats_response = supabase.table("aircraft_seatstype").select("number_of_seats").eq("aircraft_id", aircraft_id).execute()
-
-            total_seats = sum(seat["number_of_seats"] for seat in seats_response.data)
-
-            # Fetch booked seats for the flight
-            tickets_response = supabase.table("ticket").select("ticket_id").eq("flight_number", flight_number).eq("status", "active").execute()
-            booked_seats = len(tickets_response.data)
-
-            # Calculate booking percentage
-            booking_percentage = (booked_seats / total_seats) * 100 if total_seats > 0 else 0
-            booking_percentages.append({
-                "flight_number": flight_number,
-                "total_seats": total_seats,
-                "booked_seats": booked_seats,
-                "booking_percentage": booking_percentage
-            })
-
-        return booking_percentages
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=e.message)
+async def booking_percentage(request: Request, response: Response, flight_date: date, user: User = Depends(require_roles(["Admin"]))):
+    async def compute():
+        try:
+            # Fetch flights on the given date
+            flights_response = await execute(supabase.table("flight").select("flight_number, plane_id").eq("date", flight_date))
+            flights_data = flights_response.data
+
+            # Fetch capacity and booked seats for all of those flights at once
+            seat_counts, booked_counts = await asyncio.gather(
+                fetch_seat_counts([flight["plane_id"] for flight in flights_data]),
+                fetch_active_ticket_counts([flight["flight_number"] for flight in flights_data]),
+            )
+
+            booking_percentages = []
+            for flight in flights_data:
+                flight_number = flight["flight_number"]
+                total_seats = seat_counts.get(flight["plane_id"], 0)
+                booked_seats = booked_counts.get(flight_number, 0)
+
+                # Calculate booking percentage
+                booking_percentage = (booked_seats / total_seats) * 100 if total_seats > 0 else 0
+                booking_percentages.append({
+                    "flight_number": flight_number,
+                    "total_seats": total_seats,
+                    "booked_seats": booked_seats,
+                    "booking_percentage": booking_percentage
+                })
+
+            return booking_percentages
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    return await cached_report(request, response, compute)
 
 @app.get("/admin/reports/payments", response_model=List[dict[str, Any]])
-async def confirmed_payments(user: User = Depends(require_roles(["Admin"]))):
-    try:
-        # Fetch confirmed tickets
-        tickets_response = supabase.table("ticket").select("payment_id").eq("status", "confirmed").execute()
+async def confirmed_payments(request: Request, response: Response, after: Optional[int] = None,
+                             limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), stream: bool = False,
+                             fields: Optional[str] = None, user: User = Depends(require_roles(["Admin"]))):
+    columns = select_columns(Payment, fields)
 
-        payment_ids = [ticket["payment_id"] for ticket in tickets_response.data]
-        
-        if not payment_ids:
-            return []
-        
-        # Fetch payments related to the confirmed tickets
-        payments_response = supabase.table("payment").select("*").in_("payment_id", payment_ids).execute()
+    async def compute():
+        # Fetch confirmed tickets; the cursor is the last ticket_id of the page
+        def build_query():
+            return supabase.table("ticket").select("ticket_id, payment_id").eq("status", "confirmed")
 
+        async def fetch_payments(tickets):
+            payment_ids = [ticket["payment_id"] for ticket in tickets]
+            if not payment_ids:
+                return []
 
-        return payments_response.data
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=e.message)
+            # Fetch payments related to the confirmed tickets
+            payments_response = await execute(supabase.table("payment").select(", ".join(columns)).in_("payment_id", payment_ids))
+            return shape_rows(payments_response.data, columns, Payment)
+
+        return await list_response(response, build_query, "ticket_id", after, limit, stream, fetch_payments)
+
+    return await cached_report(request, response, compute)
 
 
 @app.get("/admin/reports/waitlisted_passengers")
-async def waitlisted_passengers(flight_number: str, user: User = Depends(require_roles(["Admin"]))):
-    try:
-        # Fetch waitlisted tickets for the specified flight
-        tickets_response = supabase.table("ticket").select("passenger_id").eq("flight_number", flight_number).eq("status", "waitlisted").execute()
-   
-        passenger_ids = [ticket["passenger_id"] for ticket in tickets_response.data]
-        
-        if not passenger_ids:
-            return []
-        
-        # Fetch passengers related to the waitlisted tickets
-        passengers_response = supabase.table("passenger").select("ssn").in_("ssn", passenger_ids).execute()
+async def waitlisted_passengers(request: Request, response: Response, flight_number: str, after: Optional[int] = None,
+                                limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), stream: bool = False,
+                                user: User = Depends(require_roles(["Admin"]))):
+    async def compute():
+        # Fetch waitlisted tickets for the specified flight with their person details embedded
+        def build_query():
+            return supabase.table("ticket").select(with_person("ticket_id", inner=True)).eq("flight_number", flight_number).eq("status", "waitlisted")
 
-        passenger_ssns = [passenger["ssn"] for passenger in passengers_response.data]
-        
-        # Fetch person details related to the passengers
-        persons_response = supabase.table("person").select("ssn, first_name, father_name, family, email, phone").in_("ssn", passenger_ssns).execute()
+        return await list_response(response, build_query, "ticket_id", after, limit, stream, distinct_persons)
 
-        return persons_response.data
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=e.message)
+    return await cached_report(request, response, compute)
 
 @app.get("/admin/reports/load_factor")
-async def average_load_factor(flight_date: date, user: User = Depends(require_roles(["Admin"]))):
-    try:
-        # Fetch total seats for each plane
-        planes_response = supabase.table("plane").select("registration_number, aircraft_id").execute()
-
-        seat_counts = {}
-        planes_data = planes_response.data
-        for plane in planes_data:
-            plane_id = plane["registration_number"]
-            aircraft_id = plane["aircraft_id"]
-            seats_response = supabase.table("aircraft_seatstype").select("number_of_seats").eq("aircraft_id", aircraft_id).execute()
-            if seats_response.data:
-                seat_counts[plane_id] = sum(seat["number_of_seats"] for seat in seats_response.data)
-            else:
-                seat_counts[plane_id] = 0
-
-        # Fetch booked seats for each plane on the given date
-        flights_response = supabase.table("flight").select("plane_id, flight_number").eq("date", flight_date).execute()
-
-        booked_counts = {}
-        flights_data = flights_response.data
-        for flight in flights_data:
-            plane_id = flight["plane_id"]
-            flight_number = flight["flight_number"]
-            tickets_response = supabase.table("ticket").select("ticket_id").eq("flight_number", flight_number).eq("status", "active").execute()
-            if tickets_response.data:
-                booked_counts[plane_id] = len(tickets_response.data)
-            else:
-                booked_counts[plane_id] = 0
-
-        # Combine results and calculate load factor
-        load_factors = []
-        for plane_id in seat_counts:
-            total_seats = seat_counts[plane_id]
-            booked_seats = booked_counts.get(plane_id, 0)
-            load_factor = (booked_seats / total_seats) * 100 if total_seats > 0 else 0
-            load_factors.append({
-                "registration_number": plane_id,
-                "total_seats": total_seats,
-                "booked_seats": booked_seats,
-                "load_factor": load_factor
-            })
-
-        return load_factors
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=e.message)
+async def average_load_factor(request: Request, response: Response, flight_date: date, user: User = Depends(require_roles(["Admin"]))):
+    async def compute():
+        try:
+            # Fetch total seats for each plane and the flights on the given date together
+            seat_counts, flights_response = await asyncio.gather(
+                fetch_seat_counts(),
+                execute(supabase.table("flight").select("plane_id, flight_number").eq("date", flight_date)),
+            )
+
+            # Fetch booked seats for every flight in one query
+            flights_data = flights_response.data
+            ticket_counts = await fetch_active_ticket_counts([flight["flight_number"] for flight in flights_data])
+
+            booked_counts = {}
+            for flight in flights_data:
+                booked_counts[flight["plane_id"]] = ticket_counts.get(flight["flight_number"], 0)
+
+            # Combine results and calculate load factor
+            load_factors = []
+            for plane_id in seat_counts:
+                total_seats = seat_counts[plane_id]
+                booked_seats = booked_counts.get(plane_id, 0)
+                load_factor = (booked_seats / total_seats) * 100 if total_seats > 0 else 0
+                load_factors.append({
+                    "registration_number": plane_id,
+                    "total_seats": total_seats,
+                    "booked_seats": booked_seats,
+                    "load_factor": load_factor
+                })
+
+            return load_factors
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    return await cached_report(request, response, compute)
 
 
 @app.get("/admin/reports/ticket_cancelled")
-async def cancelled_tickets(user: User = Depends(require_roles(["Admin"]))):
+async def cancelled_tickets(request: Request, response: Response, after: Optional[int] = None,
+                            limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), stream: bool = False,
+                            user: User = Depends(require_roles(["Admin"]))):
+    async def compute():
+        # Fetch cancelled tickets with their person details embedded
+        def build_query():
+            return supabase.table("ticket").select(with_person("ticket_id, seat_number, flight_number, payment_id, passenger_id")).eq("status", "cancelled")
+
+        async def add_person_details(cancelled_tickets):
+            # Combine ticket and person details
+            for ticket in cancelled_tickets:
+                ticket.update(pop_person(ticket) or {})
+            return cancelled_tickets
+
+        return await list_response(response, build_query, "ticket_id", after, limit, stream, add_person_details)
+
+    return await cached_report(request, response, compute)
+
+
+
+@app.get("/admin/reports/analytics")
+async def range_analytics(request: Request, response: Response, start_date: date, end_date: date,
+                          group_by: str = Query("flight", pattern="^(flight|plane|route|day)$"),
+                          format: str = Query("json", pattern="^(json|csv)$"),
+                          user: User = Depends(require_roles(["Admin"]))):
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="End date cannot be before start date")
+    if (end_date - start_date).days >= ANALYTICS_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range cannot exceed {ANALYTICS_MAX_DAYS} days")
+
+    async def compute():
+        try:
+            rows = await fetch_range_analytics(start_date, end_date, group_by)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if format == "csv":
+            columns = list(ANALYTICS_GROUPS[group_by]) + list(ANALYTICS_FIELDS)
+            return StreamingResponse(csv_lines(rows, columns), media_type="text/csv")
+        return rows
+
+    return await cached_report(request, response, compute)
+
+@app.get("/admin/reports/changes_by_admin", response_model=List[AdminChanges])
+async def changes_by_admin(user: User = Depends(require_roles(["Admin"]))):
     try:
-        # Fetch cancelled tickets
-        tickets_response = supabase.table("ticket").select("ticket_id, seat_number, flight_number, payment_id, passenger_id").eq("status", "cancelled").execute()
-        if tickets_response.status_code != 200:
-            raise HTTPException(status_code=400, detail="Error fetching cancelled tickets")
-        
-        cancelled_tickets = tickets_response.data
-        
-        if not cancelled_tickets:
-            return []
-        
-        passenger_ids = [ticket["passenger_id"] for ticket in cancelled_tickets]
-        
-        # Fetch passengers related to the cancelled tickets
-        passengers_response = supabase.table("passenger").select("ssn").in_("ssn", passenger_ids).execute()
-        if passengers_response.status_code != 200:
-            raise HTTPException(status_code=400, detail="Error fetching passengers")
-        
-        passenger_ssns = [passenger["ssn"] for passenger in passengers_response.data]
-        
-        # Fetch person details related to the passengers
-        persons_response = supabase.table("person").select("ssn, first_name, father_name, family, email, phone").in_("ssn", passenger_ssns).execute()
-        if persons_response.status_code != 200:
-            raise HTTPException(status_code=400, detail="Error fetching persons")
-        
-        persons = {person["ssn"]: person for person in persons_response.data}
-        
-        # Combine ticket and person details
-        for ticket in cancelled_tickets:
-            passenger_id = ticket["passenger_id"]
-            if passenger_id in persons:
-                ticket.update(persons[passenger_id])
-        
-        return cancelled_tickets
+        # Totals are kept up to date by the audit log
+        return await audit_log.change_counts()
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/admin/principal_cache/invalidate")
+async def invalidate_principal_cache(ssn: Optional[str] = None, user: User = Depends(require_roles(["Admin"]))):
+    invalidate_principal(ssn)
+    return {"message": "Principal cache invalidated"}
 
-
-@app.get("/admin/reports/changes_by_admin", response_model=List[AdminChanges])
-async def changes_by_admin(user: User = Depends(require_roles(["Admin"]))):
+@app.post("/admin/capacity/refresh")
+async def refresh_capacity(plane_id: Optional[List[str]] = Query(None), user: User = Depends(require_roles(["Admin"]))):
     try:
-        # Fetch changes by admin
-        changes_response = supabase.table("manage").select("ssn, count(*) as changes_count").group("ssn").execute()
-        if not changes_response.data:
-            raise HTTPException(status_code=400, detail="Error fetching changes by admin")
-        
-        return changes_response.data
+        await capacity_index.refresh(plane_id, force=True)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+    return {"message": "Seat capacity refreshed", "planes": len(capacity_index.planes), "version": capacity_index.version}
 
 @app.post("/maintenance", response_model=Maintenance)
 async def create_maintenance(maintenance: Maintenance, user: User = Depends(require_roles(["Employee", "Admin"]))):
     maintenance_data = maintenance.model_dump()
     try:
-        response = supabase.table("maintenance").insert(maintenance_data).execute()
+        response = await execute(supabase.table("maintenance").insert(maintenance_data))
     except Exception as e:
          raise HTTPException(status_code=400, detail=e.message)
+    latest_maintenance.record(response.data[0])
     return response.data[0]
 
 @app.get("/maintenance", response_model=List[Maintenance])
-async def get_maintenance(plane_id: Optional[str] = None, employee_id: Optional[str] = None, user: User = Depends(require_roles(["Employee", "Admin"]))):
-    query = supabase.table("maintenance").select("*")
-    if plane_id:
-        query = query.eq("plane_id", plane_id)
-    if employee_id:
-        query = query.eq("employee_id", employee_id)
-    try:
-        response = query.execute()
-    except Exception as e:
-         raise HTTPException(status_code=400, detail=e.message)
-    return response.data
+async def get_maintenance(response: Response, plane_id: Optional[str] = None, employee_id: Optional[str] = None,
+                          after: Optional[int] = None, limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+                          stream: bool = False, fields: Optional[str] = None,
+                          user: User = Depends(require_roles(["Employee", "Admin"]))):
+    columns = select_columns(Maintenance, fields)
+
+    def build_query():
+        # The cursor column is always selected and dropped again by project when fields leaves it out
+        query = supabase.table("maintenance").select(", ".join(dict.fromkeys(columns + ["maintenance_id"])))
+        if plane_id:
+            query = query.eq("plane_id", plane_id)
+        if employee_id:
+            query = query.eq("employee_id", employee_id)
+        return query
+
+    async def project(rows):
+        return shape_rows(rows, columns, Maintenance)
+
+    rows = await list_response(response, build_query, "maintenance_id", after, limit, stream, project)
+    if isinstance(rows, Response):
+        return rows
+    return json_rows(response, rows, columns, Maintenance)
 
 @app.get("/maintenance/last", response_model=List[Maintenance])
-async def get_last_maintenance(user: User = Depends(require_roles(["Employee", "Admin"]))):
+async def get_last_maintenance(plane_id: Optional[List[str]] = Query(None), user: User = Depends(require_roles(["Employee", "Admin"]))):
     try:
-        # Fetch the last maintenance records for each plane
-        last_maintenance_response = supabase.table("maintenance").select(
-            "plane_id, maintenance_id, employee_id, maintenance_type, maintenance_date, notes"
-        ).order("maintenance_date", desc=True).execute()
-        
-
-        last_maintenance_data = last_maintenance_response.data
-        last_maintenance_records = {}
-        
-        for record in last_maintenance_data:
-            plane_id = record["plane_id"]
-            if plane_id not in last_maintenance_records:
-                last_maintenance_records[plane_id] = record
-        
-        return list(last_maintenance_records.values())
+        # Read the last maintenance record of each plane from the index
+        await latest_maintenance.ensure_fresh()
     except Exception as e:
-        raise HTTPException(status_code=400, detail=e.message)
+        raise HTTPException(status_code=400, detail=str(e))
+    return latest_maintenance.get(plane_id)
 
 @app.get("/maintenance/next", response_model=List[Maintenance])
-async def get_next_maintenance(user: User = Depends(require_roles(["Employee", "Admin"]))):
-    try:
-        # Fetch the next maintenance records
-        next_maintenance_response = supabase.table("maintenance").select(
-            "plane_id, maintenance_id, employee_id, maintenance_type, maintenance_date, notes"
-        ).gt("maintenance_date", datetime.utcnow().date()).execute()
+async def get_next_maintenance(response: Response, after: Optional[int] = None,
+                               limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), stream: bool = False,
+                               user: User = Depends(require_roles(["Employee", "Admin"]))):
+    # Fetch the next maintenance records
+    def build_query():
+        return supabase.table("maintenance").select(MAINTENANCE_COLUMNS).gt("maintenance_date", datetime.utcnow().date())
 
-        return next_maintenance_response.data
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    return await list_response(response, build_query, "maintenance_id", after, limit, stream)
 
 @app.get("/available_seats/{flight_number}", response_model=List[str])
 async def get_available_seats(flight_number: str):
     try:
-        response = supabase.rpc("get_available_seats", {"flight_": flight_number}).execute()
+        seats = await seat_inventory.get(flight_number)
     except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return seats.available()
 
-        raise HTTPException(status_code=400, detail=e.message)
-    return [seat["seat_number"] for seat in response.data]
+@app.get("/available_seats/{flight_number}/events")
+async def watch_available_seats(flight_number: str):
+    # Load before the stream starts so an error is a normal 400 response
+    try:
+        await seat_inventory.get(flight_number)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(seat_hub.events(flight_number), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 # General functions
 @app.post("/token")
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     # Add your logic to authenticate the user and return a token
-    auth_response = supabase.table("person").select("*").eq("username", form_data.username).eq("password", form_data.password).execute()
+    auth_response = await execute(supabase.table("person").select("ssn").eq("username", form_data.username).eq("password", form_data.password))
     if auth_response.data:
         user = auth_response.data[0]
         access_token = create_access_token(data={"sub": user["ssn"]})
@@ -583,9 +2466,123 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
 # Endpoint to handle logout
 @app.post("/logout")
 async def logout(user: User = Depends(get_current_user), token: str = Depends(oauth2_scheme)):
-    blacklist_token(token)
+    await blacklist_token(token)
     return {"message": "Logged out successfully"}
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    trace = []
+    token = request_trace.set(trace)
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        request_trace.reset(token)
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        request_duration.observe((request.method, route_path, str(status_code)), elapsed)
+        request_queries.observe((request.method, route_path), len(trace))
+        if SLOW_REQUEST_SECONDS and elapsed >= SLOW_REQUEST_SECONDS:
+            queries = ", ".join(f"{table} {method} {duration * 1000:.1f}ms" for (table, method), duration in trace)
+            print(f"Slow request {request.method} {request.url.path} took {elapsed * 1000:.1f}ms with {len(trace)} queries: {queries}")
+
+# Startup warm-up, run in the background once the worker is serving. It
+# preloads the capacity and schedule indexes, which also proves Supabase is
+# reachable, and imports numpy for the analytics report. A failed index load
+# is retried on its own every WARMUP_RETRY_INTERVAL seconds and /readyz stays
+# 503 until both are loaded. A module that cannot be imported is only logged:
+# numpy is optional and the analytics report answers 400 without it.
+WARMUP_RETRY_INTERVAL = float(os.getenv("WARMUP_RETRY_INTERVAL", "5"))
+WARMUP_MODULES = ("numpy",)
+
+class Warmup:
+    def __init__(self, retry_interval: float):
+        self.retry_interval = retry_interval
+        self.ready = False
+        self.seconds = None
+        self.last_error = None
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _import(self, module: str):
+        try:
+            await anyio.to_thread.run_sync(importlib.import_module, module)
+        except ImportError as e:
+            print(f"Warm-up could not import {module}, continuing without it: {e}")
+
+    async def _run(self):
+        started = time.monotonic()
+        imports = asyncio.gather(*(self._import(module) for module in WARMUP_MODULES))
+        steps = {"capacity": capacity_index.refresh, "schedule": schedule_index.refresh}
+        while steps:
+            results = await asyncio.gather(*(step() for step in steps.values()), return_exceptions=True)
+            failed = {name: result for name, result in zip(steps, results) if isinstance(result, Exception)}
+            steps = {name: step for name, step in steps.items() if name in failed}
+            if steps:
+                self.last_error = "; ".join(f"{name}: {error}" for name, error in failed.items())
+                print(f"Warm-up failed, retrying {', '.join(steps)} in {self.retry_interval}s: {self.last_error}")
+                await asyncio.sleep(self.retry_interval)
+        await imports
+        self.ready = True
+        self.last_error = None
+        self.seconds = time.monotonic() - started
+
+warmup = Warmup(WARMUP_RETRY_INTERVAL)
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz(response: Response):
+    if not warmup.ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "warming up", "error": warmup.last_error}
+    return {"status": "ready", "warmup_seconds": warmup.seconds}
+
+@app.get("/metrics")
+async def metrics():
+    lines = []
+    for histogram in (request_duration, request_queries, query_duration, email_enqueue_duration, email_send_duration):
+        lines.extend(histogram.render())
+
+    caches = {"principal": principal_cache.stats(), "report": report_cache.stats()}
+    lines.extend(render_metric("cache_hits_total", "counter", "Cache hits.",
+                               [({"cache": name}, stats["hits"]) for name, stats in caches.items()]))
+    lines.extend(render_metric("cache_misses_total", "counter", "Cache misses.",
+                               [({"cache": name}, stats["misses"]) for name, stats in caches.items()]))
+    lines.extend(render_metric("cache_hit_ratio", "gauge", "Cache hit ratio since start.", [
+        ({"cache": name}, stats["hits"] / (stats["hits"] + stats["misses"]) if stats["hits"] + stats["misses"] else 0)
+        for name, stats in caches.items()]))
+    lines.extend(render_metric("cache_entries", "gauge", "Entries held by each cache.", [
+        ({"cache": "principal"}, caches["principal"]["size"]),
+        ({"cache": "report"}, caches["report"]["size"]),
+        ({"cache": "capacity"}, len(capacity_index.planes)),
+        ({"cache": "schedule"}, sum(len(flights) for flights, _ in schedule_index.routes.values())),
+        ({"cache": "seat_inventory"}, len(seat_inventory.flights)),
+        ({"cache": "idempotency"}, idempotency_store.stats()["size"]),
+    ]))
+    lines.extend(render_metric("idempotent_replays_total", "counter", "Requests answered from a stored idempotent result.",
+                               [({}, idempotency_store.stats()["replays"])]))
+    lines.extend(render_metric("email_sent_total", "counter", "Emails delivered by the outbox.", [({}, email_outbox.sent)]))
+    lines.extend(render_metric("email_failed_total", "counter", "Emails dropped after the last retry.", [({}, email_outbox.failed)]))
+    lines.extend(render_metric("audit_events_written_total", "counter", "Admin audit events written to manage.", [({}, audit_log.written)]))
+    lines.extend(render_metric("audit_events_dropped_total", "counter", "Admin audit events dropped because the buffer was full.", [({}, audit_log.dropped)]))
+    lines.extend(render_metric("audit_events_buffered", "gauge", "Admin audit events waiting to be written.", [({}, len(audit_log.buffer) + len(audit_log.in_flight))]))
+    lines.extend(render_metric("ready", "gauge", "1 once startup warm-up has finished.", [({}, int(warmup.ready))]))
+    lines.extend(render_metric("waitlist_promoted_total", "counter", "Tickets promoted from the waitlist.", [({}, waitlist_promoter.promoted)]))
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app="main:app", reload=True)
\ No newline at end of file
@@ -0,0 +1,8 @@
+-- Columns written by the admin audit log in main.py, one row per changed ticket.
+-- If manage has a primary key on (ssn, ticket_id), replace it with a surrogate
+-- key first, since an admin can change the same ticket more than once.
+alter table manage add column if not exists action text;
+alter table manage add column if not exists changed_at timestamptz not null default now();
+
+-- count_changes_by_admin groups by ssn
+create index if not exists manage_ssn_idx on manage (ssn);
@@ -0,0 +1,29 @@
+-- Aggregate functions for the admin reports in main.py.
+-- Apply once per database (Supabase SQL editor or psql). Until they exist the
+-- API falls back to one exact-count HEAD request per group.
+
+-- Active tickets per flight, used by booking_percentage, load_factor and analytics
+create or replace function count_active_tickets(flight_numbers text[])
+returns table (flight_number text, booked_seats bigint)
+language sql stable
+as $$
+    select t.flight_number::text, count(*)
+    from ticket t
+    where t.flight_number::text = any(flight_numbers)
+      and t.status = 'active'
+    group by t.flight_number
+$$;
+
+-- Rows in manage per admin, used by changes_by_admin
+create or replace function count_changes_by_admin()
+returns table (admin_ssn text, changes_count bigint)
+language sql stable
+as $$
+    select m.ssn::text, count(*)
+    from manage m
+    group by m.ssn
+    order by m.ssn
+$$;
+
+-- Lets the count fallback and count_active_tickets use an index scan
+create index if not exists ticket_flight_status_idx on ticket (flight_number, status);
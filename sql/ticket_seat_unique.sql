@@ -0,0 +1,10 @@
+-- One holding ticket per seat. Each API worker reserves seats from its own
+-- in-memory inventory, so this index is what stops two workers from selling
+-- the same seat; main.py answers the unique violation (23505) with a 409.
+-- Creation fails if the table already has double bookings; list them with
+--   select flight_number, seat_number, count(*) from ticket
+--   where status in ('active', 'confirmed') and seat_number is not null
+--   group by 1, 2 having count(*) > 1;
+create unique index if not exists ticket_seat_held_idx
+    on ticket (flight_number, seat_number)
+    where status in ('active', 'confirmed');